@@ -1,16 +1,28 @@
 from __future__ import print_function
 
+import argparse
 import os.path
+import json
 import logging
 import os
+import queue
+import signal
 import sys
+import time
+import threading
+import concurrent.futures
 from logging.handlers import RotatingFileHandler
 
 from googleapiclient.discovery import build
 from google.oauth2.service_account import Credentials
 
 from statsbot.constants import Constants
+from statsbot.freshness import Freshness
+from statsbot.journal import Journal
+from statsbot.metrics import Metrics
+from statsbot.shard import Shard
 from statsbot.stats_bot import StatsBot
+from statsbot.stats_server import StatsServer
 
 
 def init_logging():
@@ -33,12 +45,17 @@ def init_logging():
     logger.addHandler(file_handler)
 
 
+def execute_request(request, call):
+    with Metrics.get().timer("sheets", call=call):
+        return request.execute()
+
+
 def get_sheet_names(spreadsheet_service, spreadsheet_id):
     logger = logging.getLogger(Constants.LOGGER_NAME)
     result = []
 
     try:
-        sheet_metadata = spreadsheet_service.get(spreadsheetId=spreadsheet_id).execute()
+        sheet_metadata = execute_request(spreadsheet_service.get(spreadsheetId=spreadsheet_id), "get")
         sheets = sheet_metadata.get('sheets', [])
         for sheet in sheets:
             title = sheet.get("properties", {}).get("title", "")
@@ -50,139 +67,447 @@ def get_sheet_names(spreadsheet_service, spreadsheet_id):
     return result
 
 
-def get_sheet_heading(spreadsheet_service, spreadsheet_id, sheet_name):
-    result = spreadsheet_service.values().get(spreadsheetId=spreadsheet_id,
-                                              range=sheet_name + "!1:1").execute()
-    values = result.get('values', [])
-    return values[0] if values else []
+def get_sheet_headings(spreadsheet_service, spreadsheet_id, sheet_names):
+    if not sheet_names:
+        return {}
+    result = execute_request(spreadsheet_service.values().batchGet(spreadsheetId=spreadsheet_id,
+                                                                   ranges=[get_sheet_range(sheet_name, "1:1")
+                                                                           for sheet_name in sheet_names],
+                                                                   majorDimension="ROWS"), "batchGet")
+    headings = {}
+    for sheet_name, value_range in zip(sheet_names, result.get('valueRanges', [])):
+        values = value_range.get('values', [])
+        headings[sheet_name] = values[0] if values else []
+    return headings
+
+
+def get_sheet_range(sheet_name, cells):
+    return "'" + sheet_name.replace("'", "''") + "'!" + cells
+
+
+def get_column_letter(index):
+    column_letter = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        column_letter = chr(ord('A') + remainder) + column_letter
+    return column_letter
 
 
-def filter_sheet(sheet_name, heading, filters):
+def filter_sheet(sheet_name, heading, filters, optional_filters=()):
     ranges = []
     keys = []
-    sheet = {"ranges": [], "keys": []}
+    columns = []
+    sheet = {"ranges": [], "keys": [], "columns": []}
     for index, column_name in enumerate(heading):
-        for f in filters:
+        for f in list(filters) + list(optional_filters):
             if column_name == f:
-                column_letter = (chr(ord('a') + index)).upper()
-                ranges.append(sheet_name + "!" + column_letter + "2:" + column_letter)
+                column_letter = get_column_letter(index)
+                ranges.append(get_sheet_range(sheet_name, column_letter + "2:" + column_letter))
                 keys.append(column_name)
+                columns.append(column_letter)
 
-    if len(filters) == len(keys):
+    if all(f in keys for f in filters):
         sheet["ranges"] = ranges
         sheet["keys"] = keys
+        sheet["columns"] = columns
 
     return sheet
 
 
-def main():
+def map_sheet(sheet_name, heading):
+    logger = logging.getLogger(Constants.LOGGER_NAME)
+    instagram_mapping = filter_sheet(sheet_name, heading, Constants.INSTAGRAM_FILTERS,
+                                     Constants.INSTAGRAM_OPTIONAL_FILTERS)
+    whois_mapping = filter_sheet(sheet_name, heading, Constants.WHOIS_FILTERS)
+    youtube_mapping = filter_sheet(sheet_name, heading, Constants.YOUTUBE_FILTERS,
+                                   Constants.YOUTUBE_OPTIONAL_FILTERS)
+    facebook_mapping = filter_sheet(sheet_name, heading, Constants.FACEBOOK_FILTERS,
+                                    Constants.FACEBOOK_OPTIONAL_FILTERS)
+
+    mapping = {}
+    for field in ("ranges", "keys", "columns"):
+        mapping[field] = instagram_mapping[field] + \
+                         whois_mapping[field] + \
+                         youtube_mapping[field] + \
+                         facebook_mapping[field]
+    if not mapping["ranges"]:
+        logger.debug("No mapped columns in sheet %s", sheet_name)
+        return None
+
+    logger.debug("Sheet %s mapped, keys '%s'", sheet_name, str(mapping["keys"]))
+    return {"name": sheet_name, "mapping": mapping, "records": []}
+
+
+def read_sheets(spreadsheet_service, spreadsheet_id, sheets):
+    logger = logging.getLogger(Constants.LOGGER_NAME)
+    ranges = [sheet_range for sheet in sheets for sheet_range in sheet["mapping"]["ranges"]]
+    if not ranges:
+        return
+
+    # Columns of every sheet come in one request, the client switches to POST when the URL gets too long
+    logger.debug("Exporting %d column(s) from %d sheet(s)", len(ranges), len(sheets))
+    result = execute_request(spreadsheet_service.values().batchGet(spreadsheetId=spreadsheet_id,
+                                                                   ranges=ranges,
+                                                                   majorDimension="COLUMNS"), "batchGet")
+    values_ranges = result.get('valueRanges', [])
+    if not values_ranges:
+        logger.debug("No data has been exported from spreadsheet")
+        return
+
+    offset = 0
+    for sheet in sheets:
+        keys = sheet["mapping"]["keys"]
+        sheet_values = [value_range["values"][0] if value_range.get("values", []) else []
+                        for value_range in values_ranges[offset: offset + len(keys)]]
+        offset += len(keys)
+
+        max_range_len = max([len(values) for values in sheet_values] + [0])
+        records = []
+        for value_index in range(max_range_len):
+            record = {}
+            for key_index, key_value in enumerate(keys):
+                try:
+                    record[key_value] = sheet_values[key_index][value_index]
+                except IndexError as e:
+                    record[key_value] = ""
+            records.append(record)
+        sheet["records"] = records
+        logger.debug("%d record(s) exported from sheet %s", len(records), sheet["name"])
+
+
+def get_changed_ranges(sheet, updated_rows):
+    # Only runs of changed cells are written back, values read from the sheet are formatted strings
+    changed_ranges = []
+    mapping = sheet["mapping"]
+    row_indexes = sorted(updated_rows)
+    for key_value, column_letter in zip(mapping["keys"], mapping["columns"]):
+        run_start = None
+        run_values = []
+        for row_index in row_indexes + [None]:
+            changed = row_index is not None and \
+                      str(updated_rows[row_index][key_value]) != str(sheet["records"][row_index][key_value])
+            if changed and run_start is not None and row_index == run_start + len(run_values):
+                run_values.append(updated_rows[row_index][key_value])
+                continue
+            if run_start is not None:
+                first_row = run_start + Constants.SHEET_FIRST_DATA_ROW
+                last_row = first_row + len(run_values) - 1
+                changed_ranges.append({"range": get_sheet_range(sheet["name"],
+                                                                "{0}{1}:{0}{2}".format(column_letter,
+                                                                                       first_row,
+                                                                                       last_row)),
+                                       "majorDimension": "COLUMNS",
+                                       "values": [run_values]})
+                run_start = None
+                run_values = []
+            if changed:
+                run_start = row_index
+                run_values = [updated_rows[row_index][key_value]]
+    return changed_ranges
+
+
+def write_changes(spreadsheet_service, spreadsheet_id, changed_ranges):
+    logger = logging.getLogger(Constants.LOGGER_NAME)
+    if not changed_ranges:
+        logger.info("No changed cells to import")
+        return
+
+    chunks = [[]]
+    chunk_size = 0
+    for changed_range in changed_ranges:
+        range_size = len(json.dumps(changed_range))
+        if chunks[-1] and chunk_size + range_size > Constants.SHEETS_MAX_REQUEST_SIZE:
+            chunks.append([])
+            chunk_size = 0
+        chunks[-1].append(changed_range)
+        chunk_size += range_size
+
+    logger.info("Importing %d changed range(s), %d cell(s) in %d request(s)",
+                len(changed_ranges),
+                sum(len(changed_range["values"][0]) for changed_range in changed_ranges),
+                len(chunks))
+    for chunk in chunks:
+        execute_request(spreadsheet_service.values().batchUpdate(spreadsheetId=spreadsheet_id,
+                                                                 body={"valueInputOption": "USER_ENTERED",
+                                                                       "data": chunk}), "batchUpdate")
+
+
+def read_stage(spreadsheet_service, spreadsheet_id, sheets_per_read, read_queue):
+    logger = logging.getLogger(Constants.LOGGER_NAME)
+    try:
+        sheet_names = get_sheet_names(spreadsheet_service, spreadsheet_id)
+        headings = get_sheet_headings(spreadsheet_service, spreadsheet_id, sheet_names)
+        sheets = [sheet for sheet in (map_sheet(sheet_name, headings.get(sheet_name, []))
+                                      for sheet_name in sheet_names) if sheet]
+        for offset in range(0, len(sheets), sheets_per_read):
+            sheet_group = sheets[offset: offset + sheets_per_read]
+            read_sheets(spreadsheet_service, spreadsheet_id, sheet_group)
+            logger.debug("Sheet group %s has been read", str([sheet["name"] for sheet in sheet_group]))
+            read_queue.put(sheet_group)
+    finally:
+        read_queue.put(None)
+
+
+def write_stage(spreadsheet_service, spreadsheet_id, write_queue):
+    # Rows arrive as they finish extraction, changes are flushed per sheet group or once enough rows piled up
+    logger = logging.getLogger(Constants.LOGGER_NAME)
+    pending_rows = {}
+    pending_count = 0
+    error = None
+    while True:
+        item = write_queue.get()
+        if item is not None and item[0] is not None:
+            sheet, row_index, updated_record = item
+            pending_rows.setdefault(sheet["name"], (sheet, {}))[1][row_index] = updated_record
+            pending_count += 1
+            if pending_count < Constants.PIPELINE_WRITE_ROWS:
+                continue
+
+        if pending_rows and error is None:
+            try:
+                changed_ranges = []
+                for sheet, updated_rows in pending_rows.values():
+                    changed_ranges.extend(get_changed_ranges(sheet, updated_rows))
+                write_changes(spreadsheet_service, spreadsheet_id, changed_ranges)
+            except Exception as e:
+                # Keep draining the queue so the extraction stage never blocks on a dead writer
+                logger.error("Failed to import updated data: " + str(e))
+                error = e
+        pending_rows = {}
+        pending_count = 0
+        if item is None:
+            break
+    if error is not None:
+        raise error
+
+
+def read_config():
+    app_config = {}
+    with open(Constants.CONFIG_FILE) as file:
+        for line in file:
+            if line.lstrip().startswith("#"):
+                continue
+            name, value = line.partition("=")[::2]
+            app_config[name.strip().lower()] = value.strip()
+    return app_config
+
+
+def serve():
+    logger = logging.getLogger(Constants.LOGGER_NAME)
+    app_config = read_config()
+    stats_bot = StatsBot(app_config, freshness=Freshness(app_config))
+    # PORT is how hosting platforms such as Heroku hand out the port to listen on
+    port = int(os.environ.get("PORT", app_config.get(Constants.CONFIG_SERVER_PORT, Constants.SERVER_DEFAULT_PORT)))
+    stats_server = StatsServer(stats_bot,
+                               app_config.get(Constants.CONFIG_SERVER_HOST, Constants.SERVER_DEFAULT_HOST),
+                               port)
+    # shutdown() waits for serve_forever to return, so it can't run on the main thread the signal interrupts
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=stats_server.shutdown).start())
+    try:
+        stats_server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stats server stopped")
+    finally:
+        stats_server.close()
+        stats_bot.stop()
+        Metrics.get().write_report(app_config.get(Constants.CONFIG_METRICS_DIR, Constants.METRICS_DIR))
+
+
+def get_spreadsheets():
+    logger = logging.getLogger(Constants.LOGGER_NAME)
+    token_file = os.path.join(Constants.CREDENTIALS_DIR, Constants.TOKEN_FILE)
+    if not os.path.exists(token_file):
+        logger.fatal("No Google service account in %s", token_file)
+        return None
+
+    # Service account credentials refresh their token by themselves once it expires,
+    # so a resident process keeps the same client and its connection for every run
+    creds = Credentials.from_service_account_file(token_file, scopes=Constants.SPREADSHEET_SCOPES)
+    # The discovery document shipped with the client is used instead of downloading it on every start
+    service = build('sheets', 'v4', credentials=creds, static_discovery=True, cache_discovery=False)
+    return service.spreadsheets()
+
+
+def collect_spreadsheet(app_config, stats_bot, spreadsheets, write_back=True):
+    logger = logging.getLogger(Constants.LOGGER_NAME)
+
+    # Sheet groups go through a pipeline: the next group is read and the previous one written back
+    # while the current one is extracted, bounded queues keep only a few groups in memory
+    sheets_per_read = int(app_config.get(Constants.CONFIG_PIPELINE_SHEETS, Constants.PIPELINE_SHEETS))
+    read_queue = queue.Queue(Constants.PIPELINE_READ_QUEUE_SIZE)
+    write_queue = queue.Queue(Constants.PIPELINE_WRITE_QUEUE_SIZE)
+    last_run_timestamp = None
+    with concurrent.futures.ThreadPoolExecutor(2) as stages:
+        reader = stages.submit(read_stage, spreadsheets, app_config[Constants.CONFIG_SPREADSHEET_ID],
+                               sheets_per_read, read_queue)
+        writer = stages.submit(write_stage, spreadsheets, app_config[Constants.CONFIG_SPREADSHEET_ID],
+                               write_queue)
+        try:
+            sheet_group = read_queue.get()
+            while sheet_group is not None:
+                records = []
+                record_sheets = []
+                for sheet in sheet_group:
+                    records.extend(sheet["records"])
+                    record_sheets.extend((sheet, row_index) for row_index in range(len(sheet["records"])))
+
+                if records:
+                    logger.info("%d record(s) will be processed from sheet(s) %s",
+                                len(records), str([sheet["name"] for sheet in sheet_group]))
+                    _, last_run_timestamp = stats_bot.run(
+                        records,
+                        (lambda index, record: write_queue.put((*record_sheets[index], record))) if write_back else None)
+                    write_queue.put((None, None, None))
+                sheet_group = read_queue.get()
+        finally:
+            write_queue.put(None)
+            while sheet_group is not None:
+                sheet_group = read_queue.get()
+        reader.result()
+        writer.result()
+
+    if last_run_timestamp is None:
+        logger.info("No records to process in spreadsheet")
+        return None
+
+    date_str = str(last_run_timestamp.strftime("%Y-%m-%d %H:%M:%S"))
+    logger.info("Last run timestamp set to %s", date_str)
+    # spreadsheets.batchUpdate(spreadsheetId=app_config[Constants.CONFIG_SPREADSHEET_ID],
+    #                          body={"requests": {
+    #                              "updateSpreadsheetProperties": {
+    #                                  "properties": {
+    #                                      "title": date_str
+    #                                  },
+    #                                  "fields": "title"
+    #                              }
+    #                          }}).execute()
+    return last_run_timestamp
+
+
+def run_daemon():
     logger = logging.getLogger(Constants.LOGGER_NAME)
 
     if not os.path.exists(Constants.CREDENTIALS_DIR):
         os.makedirs(Constants.CREDENTIALS_DIR)
 
+    app_config = read_config()
+    interval = float(app_config.get(Constants.CONFIG_DAEMON_INTERVAL, Constants.DAEMON_DEFAULT_INTERVAL)) * 60
+    metrics_dir = app_config.get(Constants.CONFIG_METRICS_DIR, Constants.METRICS_DIR)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    # Extractors log in, open their pools and load their caches once, every scheduled run reuses them
+    journal = Journal(Constants.JOURNAL_FILE)
+    stats_bot = StatsBot(app_config, journal=journal, freshness=Freshness(app_config))
     try:
-        app_config = {}
-        with open(Constants.CONFIG_FILE) as file:
-            for line in file:
-                name, value = line.partition("=")[::2]
-                app_config[name.strip().lower()] = value.strip()
-        stats_bot = StatsBot(app_config)
-
-        if os.path.exists(os.path.join(Constants.CREDENTIALS_DIR, Constants.TOKEN_FILE)):
-            creds = Credentials.from_service_account_file(os.path.join(Constants.CREDENTIALS_DIR, Constants.TOKEN_FILE),
-                                                          scopes=Constants.SPREADSHEET_SCOPES)
-        else:
-            logger.fatal("No Google service account in %s",
-                         os.path.exists(os.path.join(Constants.CREDENTIALS_DIR, Constants.TOKEN_FILE)))
+        spreadsheets = get_spreadsheets()
+        if spreadsheets is None:
             return
 
-        service = build('sheets', 'v4', credentials=creds)
-        spreadsheets = service.spreadsheets()
-
-        sheet_names = get_sheet_names(spreadsheets, app_config[Constants.CONFIG_SPREADSHEET_ID])
-        for sheet_name in sheet_names:
-            logger.debug("Processing sheet %s", sheet_name)
-            sheet_heading = get_sheet_heading(spreadsheets, app_config[Constants.CONFIG_SPREADSHEET_ID], sheet_name)
-
-            instagram_mapping = filter_sheet(sheet_name, sheet_heading, Constants.INSTAGRAM_FILTERS)
-            whois_mapping = filter_sheet(sheet_name, sheet_heading, Constants.WHOIS_FILTERS)
-            youtube_mapping = filter_sheet(sheet_name, sheet_heading, Constants.YOUTUBE_FILTERS)
-            facebook_mapping = filter_sheet(sheet_name, sheet_heading, Constants.FACEBOOK_FILTERS)
-
-            mapping = {"ranges": instagram_mapping["ranges"] +
-                                 whois_mapping["ranges"] +
-                                 youtube_mapping["ranges"] +
-                                 facebook_mapping["ranges"],
-                       "keys": instagram_mapping["keys"] +
-                               whois_mapping["keys"] +
-                               youtube_mapping["keys"] +
-                               facebook_mapping["keys"]}
-            if not mapping["ranges"]:
-                logger.debug("No mapped columns in sheet %s", sheet_name)
-                continue
+        next_run = time.time()
+        while not stop_event.wait(max(0.0, next_run - time.time())):
+            logger.info("Scheduled run started")
+            failed = True
+            try:
+                collect_spreadsheet(app_config, stats_bot, spreadsheets)
+                journal.truncate()
+                failed = False
+            except Exception as e:
+                logger.error("Scheduled run failed: " + str(e))
+            # Results of this run must not leak into the next one, caches and sessions stay
+            stats_bot.clear_lookup_results()
+            stats_bot.flush(failed)
+            try:
+                Metrics.get().write_report(metrics_dir)
+            except OSError as e:
+                logger.error("Failed to write run report: " + str(e))
+            Metrics.get().reset()
+
+            next_run = max(next_run + interval, time.time())
+            logger.info("Next run at %s", time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(next_run)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("Daemon stopped")
+        # Every finished run has been flushed already, anything left belongs to an interrupted one
+        stats_bot.stop(failed=True)
 
-            logger.debug("Exporting data from sheet %s, keys '%s'", sheet_name, str(mapping["keys"]))
-            result = spreadsheets.values().batchGet(spreadsheetId=app_config[Constants.CONFIG_SPREADSHEET_ID],
-                                                    ranges=mapping["ranges"],
-                                                    majorDimension="COLUMNS").execute()
-            values_ranges = result.get('valueRanges', [])
-            if not values_ranges:
-                logger.debug("No data has been exported from sheet %s", sheet_name)
-                continue
 
-            max_range_len = 0
-            for value_range in values_ranges:
-                range_len = len(value_range["values"][0]) if value_range.get("values", []) else 0
-                if range_len > max_range_len:
-                    max_range_len = range_len
-
-            records = []
-            for value_index in range(max_range_len):
-                record = {}
-                for key_index, key_value in enumerate(mapping["keys"]):
-                    try:
-                        record[key_value] = values_ranges[key_index]["values"][0][value_index]
-                    except (IndexError, KeyError) as e:
-                        record[key_value] = ""
-                records.append(record)
-
-            logger.info("%d record(s) will be processed from sheet %s", len(records), sheet_name)
-            updated_records, last_run_timestamp = stats_bot.run(records)
-
-            output_data = {"valueInputOption": "USER_ENTERED", "data": []}
-            for key_index, key_value in enumerate(mapping["keys"]):
-                output_range = {"range": mapping["ranges"][key_index],
-                                "majorDimension": "COLUMNS"}
-                output_range_values = []
-
-                for record in updated_records:
-                    output_range_values.append(record[key_value])
-
-                output_range["values"] = [output_range_values]
-                output_data["data"].append(output_range)
-
-            logger.debug("Importing updated data to sheet %s", sheet_name)
-            spreadsheets.values().batchUpdate(spreadsheetId=app_config[Constants.CONFIG_SPREADSHEET_ID],
-                                              body=output_data).execute()
-
-        date_str = str(last_run_timestamp.strftime("%Y-%m-%d %H:%M:%S"))
-        logger.info("Last run timestamp set to %s", date_str)
-        # spreadsheets.batchUpdate(spreadsheetId=app_config[Constants.CONFIG_SPREADSHEET_ID],
-        #                          body={"requests": {
-        #                              "updateSpreadsheetProperties": {
-        #                                  "properties": {
-        #                                      "title": date_str
-        #                                  },
-        #                                  "fields": "title"
-        #                              }
-        #                          }}).execute()
+def main(resume=False, shard=None, merge_shards=False, run_id=None):
+    logger = logging.getLogger(Constants.LOGGER_NAME)
+
+    if not os.path.exists(Constants.CREDENTIALS_DIR):
+        os.makedirs(Constants.CREDENTIALS_DIR)
+
+    # Either may still be unset when reading the config or starting the extractors fails
+    app_config = None
+    stats_bot = None
+    failed = True
+    try:
+        app_config = read_config()
+        # Shard workers only extract their part of the keys into the shared lease database,
+        # the coordinator then merges those results into the single write-back
+        shard_database = app_config.get(Constants.CONFIG_SHARD_DATABASE,
+                                        os.path.join(Constants.CACHE_DIR, Constants.SHARD_DATABASE_FILE))
+        # Workers and the coordinator started on the same UTC day belong to the same run unless told otherwise
+        run_id = run_id or time.strftime(Constants.SHARD_RUN_ID_FORMAT, time.gmtime())
+        worker_shard = None
+        journal_file = Constants.JOURNAL_FILE
+        if shard:
+            worker_shard = Shard.from_argument(shard, shard_database, run_id)
+            journal_file = Constants.SHARD_JOURNAL_FILE.format(worker_shard.index, worker_shard.count)
+            logger.info("Running as shard %d/%d of run %s, results go to %s",
+                        worker_shard.index, worker_shard.count, run_id, shard_database)
+        elif merge_shards:
+            worker_shard = Shard(0, 1, shard_database, run_id)
+            logger.info("Merging shard results of run %s from %s", run_id, shard_database)
+
+        # Every finished lookup is journaled, a resumed run replays the journal and only fetches what is missing.
+        # Shard workers share the cache directory, so only single processes keep the freshness record
+        stats_bot = StatsBot(app_config, journal=Journal(journal_file, resume), shard=worker_shard,
+                             freshness=None if shard else Freshness(app_config))
+
+        spreadsheets = get_spreadsheets()
+        if spreadsheets is None:
+            return
+
+        collect_spreadsheet(app_config, stats_bot, spreadsheets, write_back=not shard)
+        if merge_shards:
+            # The next run must look everything up again instead of writing these results back
+            worker_shard.clear()
+        failed = False
     except Exception as e:
         logger.error("Unrecoverable execution error: " + str(e))
     finally:
-        stats_bot.stop()
+        if stats_bot is not None:
+            stats_bot.stop(failed)
+        try:
+            Metrics.get().write_report((app_config or {}).get(Constants.CONFIG_METRICS_DIR, Constants.METRICS_DIR))
+        except OSError as e:
+            logger.error("Failed to write run report: " + str(e))
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collect social network statistics into a Google spreadsheet")
+    parser.add_argument("--resume", action="store_true",
+                        help="reuse results journaled by an interrupted run instead of fetching them again")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="extract only shard I of N into the shared lease database, without writing the spreadsheet")
+    parser.add_argument("--merge-shards", action="store_true",
+                        help="write back results collected by shard workers, fetching whatever they left out")
+    parser.add_argument("--run-id",
+                        help="run shared by --shard workers and --merge-shards, the current UTC date by default")
+    parser.add_argument("--serve", action="store_true",
+                        help="serve the /stats endpoint used by appscript/Statistics.gs instead of a single run")
+    parser.add_argument("--daemon", action="store_true",
+                        help="stay resident and run on the DAEMON_INTERVAL schedule with warm sessions and clients")
+    args = parser.parse_args()
+
     init_logging()
-    main()
+    if args.serve:
+        serve()
+    elif args.daemon:
+        run_daemon()
+    else:
+        main(args.resume, args.shard, args.merge_shards, args.run_id)
@@ -3,7 +3,7 @@ SHEET_TO_JSON_SERVICE = "https://opensheet.vercel.app/"
 APP_HOST = "https://whispering-citadel-12723.herokuapp.com/"
 APP_STATS_ENDPOINT = "stats"
 
-WAIT_RESULT_TIMEOUT = 20000; // in miliseconds
+WAIT_RESULT_TIMEOUT = 50; // in seconds, the server answers as soon as the results are ready
 
 function onOpen() {
   SpreadsheetApp.getUi()
@@ -23,16 +23,27 @@ function createTimeTrigger() {
 }
 
 function refreshStatistics() {
-  data = []
-  forceCollecting();
+  var jobId = forceCollecting();
+  if (!jobId) {
+    return;
+  }
 
-  while (data.length === 0) {
-    SpreadsheetApp.getActive().toast("Waiting " + WAIT_RESULT_TIMEOUT + " ms for updates", "⏰: In progress");
-    Utilities.sleep(WAIT_RESULT_TIMEOUT);
-    data = getCachedStatistics();
+  var state = {"status": "queued"};
+  while (state.status !== "done") {
+    SpreadsheetApp.getActive().toast("Waiting up to " + WAIT_RESULT_TIMEOUT + " s for updates", "⏰: In progress");
+    state = getJobState(jobId);
+    // Unknown jobs (e.g. after a server restart) and server errors never finish, so stop asking
+    if (state === null) {
+      return;
+    }
+    if (state.status === "failed") {
+      SpreadsheetApp.getActive().toast("Statistics collection failed: " + state.error + "\n" +
+                                   "Please, re-check your data and try again or see server logs", "⚠️ Error");
+      return;
+    }
   }
 
-  updateSheetData(data);
+  updateSheetData(state.rows);
 }
 
 function timeTrigger() {
@@ -44,7 +55,7 @@ function forceCollecting() {
   if (response.getResponseCode() !== 200) {
     SpreadsheetApp.getActive().toast("Sheets to JSON service failed: response code " + response.getResponseCode() + "\n" +
                                  "Please, re-check your data and try again.", "⚠️ Warning");
-    return;
+    return "";
   }
 
   SpreadsheetApp.getActive().toast("Sending request for statistics update...", " ⏰: Processing...");
@@ -58,24 +69,35 @@ function forceCollecting() {
   if (response.getResponseCode() !== 200) {
     SpreadsheetApp.getActive().toast("Failed to send data to refreshing statitsitcs: response code " + 
       response.getResponseCode() + "\n" + "Please, re-check your data and try again or see server logs", "⚠️ Error");
-    return;
+    return "";
   }
+  return JSON.parse(response.getContentText()).job_id;
 }
 
 function getCachedStatistics() {
+  var response = fetchStatistics("");
+  return response === null ? [] : response;
+}
+
+function getJobState(jobId) {
+  // The request is held until that job finishes or WAIT_RESULT_TIMEOUT passes
+  return fetchStatistics("?job=" + jobId + "&wait=" + WAIT_RESULT_TIMEOUT);
+}
+
+function fetchStatistics(query) {
   var options = {
     "method" : "get",
     "muteHttpExceptions": true,
   };
 
-  response = UrlFetchApp.fetch(APP_HOST + "/" + APP_STATS_ENDPOINT, options)
+  var response = UrlFetchApp.fetch(APP_HOST + "/" + APP_STATS_ENDPOINT + query, options)
   if (response.getResponseCode() !== 200) {
     SpreadsheetApp.getActive().toast("Failed to refresh stats: response code " + response.getResponseCode() + "\n" +
                                  "Please, re-check your data and try again.", "⚠️ Error");
-    return [];
+    return null;
   }
 
-  return JSON.parse(response.getContentText()); 
+  return JSON.parse(response.getContentText());
 }
 
 function updateSheetData(data) {
@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import time
+
+from statsbot.constants import Constants
+from statsbot.extractor import Extractor
+from statsbot.stats_bot import StatsBot
+
+
+class BlockingExtractor(Extractor):
+
+    def __init__(self, platform, latency):
+        self.PLATFORM = platform
+        self.latency = latency
+
+    def get_stats(self, user):
+        time.sleep(self.latency)
+        return {self.PLATFORM: user["row"]}
+
+
+class NativeAsyncExtractor(BlockingExtractor):
+    NATIVE_ASYNC = True
+
+    async def get_stats_async(self, user):
+        await asyncio.sleep(self.latency)
+        return {self.PLATFORM: user["row"]}
+
+
+def make_extractors(latency):
+    return [NativeAsyncExtractor(Constants.WHOIS_PLATFORM, latency),
+            BlockingExtractor(Constants.INSTAGRAM_PLATFORM, latency),
+            NativeAsyncExtractor(Constants.YOUTUBE_PLATFORM, latency),
+            BlockingExtractor(Constants.FACEBOOK_PLATFORM, latency)]
+
+
+def measure(config, rows, latency):
+    extractors = make_extractors(latency)
+    stats_bot = StatsBot(config, extractors)
+    users = [{"row": index} for index in range(rows)]
+    started = time.perf_counter()
+    updated_users, _ = stats_bot.run(users)
+    elapsed = time.perf_counter() - started
+
+    # Every row must come back with its own results only, merged once per extractor
+    for index, user in enumerate(updated_users):
+        assert user == {"row": index, **{extractor.PLATFORM: index for extractor in extractors}}, user
+    assert stats_bot.merge_count == rows * len(extractors), stats_bot.merge_count
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare thread and asyncio run modes on simulated network latency")
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated request latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=100, help="per-platform limit in both modes")
+    parser.add_argument("--threadpool-size", type=int, help="per-platform thread cap, defaults to --concurrency")
+    args = parser.parse_args()
+
+    # Thread mode sizes each pool as min(THREADPOOL_SIZE, <PLATFORM>_CONCURRENCY), both modes get the same
+    # per-platform limits so only the scheduling model differs
+    limits = {Constants.CONFIG_CONCURRENCY.format(platform): str(args.concurrency)
+              for platform in Constants.DEFAULT_CONCURRENCY}
+    limits[Constants.CONFIG_THREADPOOL_SIZE] = str(args.threadpool_size or args.concurrency)
+    thread_config = {Constants.CONFIG_RUN_IN_PARALLEL: "1", **limits}
+    async_config = {Constants.CONFIG_RUN_IN_PARALLEL: Constants.RUN_MODE_ASYNC, **limits}
+
+    for mode, config in (("threads", thread_config), ("async", async_config)):
+        elapsed = measure(config, args.rows, args.latency)
+        print("{0:>8}: {1} rows in {2:.2f}s, {3:.0f} rows/sec".format(mode, args.rows, elapsed, args.rows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from statsbot.constants import Constants
+from benchmark.stand_ins import CallCounter, StandInServer, WhoIsStandIn, Port43StandIn, FakeSheetsService, \
+    install_fake_libraries, make_spreadsheet
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_config(args):
+    config = {Constants.CONFIG_INSTAGRAM_USERNAME: "bench",
+              Constants.CONFIG_INSTAGRAM_PASSWORD: "bench",
+              Constants.CONFIG_FACEBOOK_USERNAME: "bench",
+              Constants.CONFIG_FACEBOOK_PASSWORD: "bench",
+              Constants.CONFIG_YOUTUBE_TOKEN: "bench",
+              Constants.CONFIG_SPREADSHEET_ID: "bench",
+              Constants.CONFIG_RUN_IN_PARALLEL: args.mode,
+              Constants.CONFIG_THREADPOOL_SIZE: args.threadpool_size,
+              Constants.CONFIG_WHOIS_HEDGE_DELAY: 0,
+              Constants.CONFIG_WHOIS_MODE: Constants.WHOIS_MODE_HTML if args.whois_mode == "html"
+              else Constants.WHOIS_MODE_NATIVE}
+    for platform in Constants.DEFAULT_CONCURRENCY:
+        config[Constants.CONFIG_CONCURRENCY.format(platform)] = args.concurrency
+    with open(Constants.CONFIG_FILE, "w") as f:
+        for name, value in config.items():
+            f.write("{0}={1}\n".format(name.upper(), value))
+    os.makedirs(Constants.CREDENTIALS_DIR, exist_ok=True)
+    open(os.path.join(Constants.CREDENTIALS_DIR, Constants.TOKEN_FILE), "w").close()
+
+
+def run_child(args):
+    # Runs inside a scratch directory, so caches, journals and reports never touch the repository
+    logging.getLogger(Constants.LOGGER_NAME).addHandler(logging.NullHandler())
+    logging.getLogger(Constants.LOGGER_NAME).propagate = False
+
+    counter = CallCounter(args.latency, args.error_rate)
+    install_fake_libraries(counter)
+    server = StandInServer(counter).start()
+
+    import application
+    from statsbot.http_client import HttpClient
+    from statsbot.who_is_extractor import WhoIsExtractor
+    from statsbot.whois_client import WhoIsClient
+    from statsbot.youtube_extractor import YoutubeExtractor
+
+    WhoIsExtractor.CONFIG = WhoIsStandIn.get_config(server.base_url)
+    registrar = Port43StandIn(counter).start()
+    registry = Port43StandIn(counter, referral=registrar.address).start()
+    iana = Port43StandIn(counter, referral=registry.address, iana=True).start()
+    WhoIsClient.SERVERS = {"com": registry.address}
+    WhoIsClient.IANA_SERVER = iana.address
+    WhoIsClient.RDAP_SERVERS = {"com": server.base_url + "rdap/"} if args.whois_mode == "rdap" else {}
+    YoutubeExtractor.CHANNEL_INFO_ENDPOINT = server.base_url + "youtube/channels?part={0}&id={1}&maxResults={2}&key={3}"
+    YoutubeExtractor.PLAYLIST_ITEMS_ENDPOINT = server.base_url + \
+        "youtube/playlistItems?part=contentDetails&playlistId={0}&maxResults={1}&pageToken={2}&key={3}"
+
+    sheets_service = FakeSheetsService(make_spreadsheet(args.rows, args.sheets, args.duplicates), counter)
+    application.build = lambda *build_args, **build_kwargs: sheets_service
+    application.Credentials.from_service_account_file = lambda *credential_args, **credential_kwargs: None
+    write_config(args)
+
+    started = time.perf_counter()
+    application.main()
+    elapsed = time.perf_counter() - started
+    server.stop()
+    registry.stop()
+    registrar.stop()
+    iana.stop()
+
+    print(json.dumps({"mode": args.mode,
+                      "rows": args.rows,
+                      "seconds": elapsed,
+                      "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+                      "calls": dict(counter.calls),
+                      "http": HttpClient.get().get_connection_stats(),
+                      "updated_cells": sheets_service.updated_cells}))
+
+
+def run_parent(args):
+    print("{0:>8} {1:>8} {2:>9} {3:>10} {4:>12} {5:>10} {6:>11}  {7}".format("mode", "rows", "seconds", "rows/sec",
+                                                                             "peak RSS MB", "calls/row",
+                                                                             "http reuse", "calls"))
+    for rows in args.rows_list:
+        for mode in args.modes.split(","):
+            with tempfile.TemporaryDirectory() as work_dir:
+                command = [sys.executable, "-m", "benchmark.offline", "--child",
+                           "--mode", mode,
+                           "--rows", str(rows),
+                           "--sheets", str(args.sheets),
+                           "--duplicates", str(args.duplicates),
+                           "--latency", str(args.latency),
+                           "--error-rate", str(args.error_rate),
+                           "--threadpool-size", str(args.threadpool_size),
+                           "--concurrency", str(args.concurrency),
+                           "--whois-mode", args.whois_mode]
+                environment = dict(os.environ, PYTHONPATH=REPOSITORY_DIR)
+                output = subprocess.run(command, cwd=work_dir, env=environment, check=True,
+                                        stdout=subprocess.PIPE, universal_newlines=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            calls = sum(result["calls"].values())
+            # Share of HTTP requests served over an already open keep-alive connection
+            http_requests = sum(stats["requests"] for stats in result["http"].values())
+            http_reused = sum(stats["reused"] for stats in result["http"].values())
+            print("{0:>8} {1:>8} {2:>9.2f} {3:>10.0f} {4:>12.1f} {5:>10.2f} {6:>10.0%}  {7}".format(
+                mode, rows, result["seconds"], rows / result["seconds"], result["peak_rss_mb"],
+                calls / rows, http_reused / max(http_requests, 1), json.dumps(result["calls"], sort_keys=True)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run application.main against local stand-ins for every external service")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000], dest="rows_list")
+    parser.add_argument("--modes", default="0,1,async", help="comma separated RUN_IN_PARALLEL values")
+    parser.add_argument("--sheets", type=int, default=4)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="share of rows repeating an earlier page")
+    parser.add_argument("--latency", type=float, default=0.002, help="stand-in latency per call in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--threadpool-size", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=8, help="per-platform concurrency limit")
+    parser.add_argument("--whois-mode", choices=["html", "native", "rdap"], default="html",
+                        help="html scrapers, native port 43 lookups or native RDAP lookups")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.rows = args.rows_list[0]
+        run_child(args)
+    else:
+        run_parent(args)
+
+
+if __name__ == '__main__':
+    main()
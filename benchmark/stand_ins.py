@@ -0,0 +1,371 @@
+import sys
+import json
+import time
+import types
+import random
+import zlib
+import datetime
+import threading
+import socketserver
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from statsbot.constants import Constants
+
+
+class CallCounter:
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def call(self, name):
+        # Sleeps like a remote call and reports whether this call should fail
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            failed = self.random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        return failed
+
+    def get_total(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+
+def get_number(key, modulo):
+    return zlib.crc32(str(key).encode("utf-8")) % modulo
+
+
+def get_creation_year(domain):
+    return 1995 + get_number(domain, 25)
+
+
+def get_post_times(key, count=12):
+    # Deterministic posting history: one post every few days, newest first
+    now = datetime.datetime.now(datetime.timezone.utc)
+    step = 1 + get_number(key, 6)
+    return [now - datetime.timedelta(days=index * step, hours=1) for index in range(count)]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes: without TCP_NODELAY every response on a kept-alive
+    # connection would wait for a delayed ACK, which real servers don't do
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        if self.server.counter.call(parts[0]):
+            self._send(503, b"Service Unavailable", "text/plain")
+        elif parts[0] == "youtube" and parts[1] == "channels":
+            self._send_json({"items": [self._get_channel(channel_id, query["part"][0])
+                                       for channel_id in query["id"][0].split(",")]})
+        elif parts[0] == "youtube" and parts[1] == "playlistItems":
+            playlist_id = query["playlistId"][0]
+            self._send_json({"etag": '"{0}"'.format(get_number(playlist_id, 1000)),
+                             "items": [{"contentDetails": {"videoPublishedAt": post_time.strftime("%Y-%m-%dT%H:%M:%SZ")}}
+                                       for post_time in get_post_times(playlist_id)]})
+        elif parts[0] == "rdap" and parts[1] == "domain":
+            self._send_json({"objectClassName": "domain",
+                             "ldhName": parts[2].upper(),
+                             "events": [{"eventAction": "registration",
+                                         "eventDate": "{0}-03-14T10:00:00Z".format(get_creation_year(parts[2]))},
+                                        {"eventAction": "last changed",
+                                         "eventDate": "2024-01-01T00:00:00Z"}]})
+        elif parts[0] == "whois":
+            provider = WhoIsStandIn.PROVIDERS[int(parts[1])]
+            domain = url.path.rsplit("/", 1)[-1] or query.get("searchWord", [""])[0]
+            body = '<html><body><pre class="{0}">Domain Name: {1}\nCreation Date: {2}-03-14T10:00:00Z\n</pre></body></html>'
+            self._send(200, body.format(provider["tags"][0], domain, get_creation_year(domain)).encode(), "text/html")
+        else:
+            self._send(404, b"Not Found", "text/plain")
+
+    def _get_channel(self, channel_id, part):
+        channel = {"id": channel_id,
+                   "statistics": {"videoCount": str(10 + get_number(channel_id, 500)),
+                                  "subscriberCount": str(get_number(channel_id, 100000))}}
+        if "contentDetails" in part:
+            channel["contentDetails"] = {"relatedPlaylists": {"uploads": "UU" + channel_id}}
+        return channel
+
+    def _send_json(self, data):
+        self._send(200, json.dumps(data).encode(), "application/json")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, counter):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.counter = counter
+        self.base_url = "http://127.0.0.1:{0}/".format(self.server_port)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class Port43Handler(socketserver.StreamRequestHandler):
+    # Registry answers refer every other domain to the registrar server, which puts the creation date
+    # in front of a long legal notice that a streaming client never needs to read
+    def handle(self):
+        domain = self.rfile.readline().decode("idna").strip().lower()
+        server = self.server
+        if server.counter.call("whois43"):
+            return
+        if server.iana:
+            self._handle_iana(domain)
+            return
+        lines = ["Domain Name: {0}".format(domain.upper())]
+        if server.referral and get_number(domain, 2):
+            lines.append("Registrar WHOIS Server: {0}".format(server.referral))
+        else:
+            lines.append("Updated Date: 2024-01-01T00:00:00Z")
+            lines.append("Creation Date: {0}-03-14T10:00:00Z".format(get_creation_year(domain)))
+        lines.append(">>> Last update of whois database: 2024-01-01T00:00:00Z <<<")
+        lines.append("")
+        try:
+            self.wfile.write("\r\n".join(lines).encode())
+            self.wfile.flush()
+            for _ in range(server.notice_chunks):
+                self.wfile.write(b"NOTICE: The data in this record is provided for information purposes only.\r\n" * 50)
+                self.wfile.flush()
+        except OSError:
+            # The client hung up as soon as it had the date
+            pass
+
+    def _handle_iana(self, domain):
+        # IANA answers with the record of the TLD, its creation date is the delegation and not the domain's
+        lines = ["% IANA WHOIS server",
+                 "",
+                 "refer:        {0}".format(self.server.referral),
+                 "",
+                 "domain:       {0}".format(domain.rsplit(".", 1)[-1].upper()),
+                 "organisation: Stand-in Registry",
+                 "whois:        {0}".format(self.server.referral),
+                 "status:       ACTIVE",
+                 "created:      1985-01-01",
+                 "changed:      2024-01-01",
+                 "source:       IANA",
+                 ""]
+        try:
+            self.wfile.write("\n".join(lines).encode())
+        except OSError:
+            pass
+
+
+class Port43StandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, counter, referral="", notice_chunks=20, iana=False):
+        super().__init__(("127.0.0.1", 0), Port43Handler)
+        self.counter = counter
+        self.referral = referral
+        self.iana = iana
+        self.notice_chunks = notice_chunks
+        self.address = "127.0.0.1:{0}".format(self.server_address[1])
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class WhoIsStandIn:
+    PROVIDERS = [{"tags": ["registryData", "registrarData"]},
+                 {"tags": ["raw-domain-info-pre"]},
+                 {"tags": ["Whois-card"]}]
+
+    @classmethod
+    def get_config(cls, base_url):
+        return [{"whois": "{0}whois/{1}/".format(base_url, index), "tags": provider["tags"]}
+                for index, provider in enumerate(cls.PROVIDERS)]
+
+
+def install_fake_libraries(counter):
+    # Must run before statsbot extractors are imported, they bind library names at import time
+    instagrapi = types.ModuleType("instagrapi")
+    instagrapi_exceptions = types.ModuleType("instagrapi.exceptions")
+    for name in ("ClientThrottledError", "PleaseWaitFewMinutes", "RateLimitError",
+                 "ChallengeRequired", "LoginRequired", "ClientError"):
+        setattr(instagrapi_exceptions, name, type(name, (Exception,), {}))
+
+    class Client:
+
+        def load_settings(self, path):
+            pass
+
+        def dump_settings(self, path):
+            pass
+
+        def login(self, username, password, relogin=False):
+            counter.call("instagram")
+            return True
+
+        def user_id_from_username(self, username):
+            self._call()
+            return str(get_number(username, 10 ** 9))
+
+        def user_info(self, user_id):
+            self._call()
+            return types.SimpleNamespace(media_count=12, follower_count=get_number(user_id, 100000))
+
+        def user_medias_paginated(self, user_id, amount, end_cursor=""):
+            self._call()
+            return [types.SimpleNamespace(taken_at=post_time) for post_time in get_post_times(user_id)[:amount]], ""
+
+        def _call(self):
+            if counter.call("instagram"):
+                raise instagrapi_exceptions.ClientError("Stand-in failure")
+
+    instagrapi.Client = Client
+    instagrapi.exceptions = instagrapi_exceptions
+
+    facebook_scraper = types.ModuleType("facebook_scraper")
+    facebook_scraper_exceptions = types.ModuleType("facebook_scraper.exceptions")
+    facebook_scraper_exceptions.TemporarilyBanned = type("TemporarilyBanned", (Exception,), {})
+
+    def call_facebook():
+        if counter.call("facebook"):
+            raise RuntimeError("Stand-in failure")
+
+    def get_page_info(page_name, **kwargs):
+        call_facebook()
+        return {"followers": get_number(page_name, 100000)}
+
+    def get_posts(page_name, **kwargs):
+        call_facebook()
+        for index, post_time in enumerate(get_post_times(page_name)):
+            yield {"post_id": "{0}_{1}".format(page_name, index), "time": post_time.replace(tzinfo=None)}
+
+    facebook_scraper.set_cookies = lambda path: None
+    facebook_scraper.get_page_info = get_page_info
+    facebook_scraper.get_posts = get_posts
+    facebook_scraper.exceptions = facebook_scraper_exceptions
+
+    sys.modules.update({"instagrapi": instagrapi,
+                        "instagrapi.exceptions": instagrapi_exceptions,
+                        "facebook_scraper": facebook_scraper,
+                        "facebook_scraper.exceptions": facebook_scraper_exceptions})
+
+
+class FakeRequest:
+
+    def __init__(self, counter, name, handler):
+        self.counter = counter
+        self.name = name
+        self.handler = handler
+
+    def execute(self):
+        if self.counter.call(self.name):
+            raise RuntimeError("Stand-in Sheets failure")
+        return self.handler()
+
+
+class FakeSheetsService:
+    # In-memory stand-in for build('sheets', 'v4'): every sheet is a list of rows of strings
+
+    def __init__(self, sheets, counter):
+        self.sheets = sheets
+        self.counter = counter
+        self.updated_cells = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId):
+        return FakeRequest(self.counter, "sheets",
+                           lambda: {"sheets": [{"properties": {"title": title}} for title in self.sheets]})
+
+    def batchGet(self, spreadsheetId, ranges, majorDimension):
+        return FakeRequest(self.counter, "sheets",
+                           lambda: {"valueRanges": [self._get_range(cells_range, majorDimension)
+                                                    for cells_range in ranges]})
+
+    def batchUpdate(self, spreadsheetId, body):
+        return FakeRequest(self.counter, "sheets", lambda: self._update(body))
+
+    def _parse_range(self, cells_range):
+        sheet_name, _, cells = cells_range.rpartition("!")
+        sheet_name = sheet_name[1:-1].replace("''", "'") if sheet_name.startswith("'") else sheet_name
+        start, _, end = cells.partition(":")
+        return sheet_name, self._parse_cell(start), self._parse_cell(end or start)
+
+    def _parse_cell(self, cell):
+        column = 0
+        row = ""
+        for char in cell:
+            if char.isalpha():
+                column = column * 26 + ord(char.upper()) - ord('A') + 1
+            else:
+                row += char
+        return column - 1, int(row) - 1 if row else None
+
+    def _get_range(self, cells_range, major_dimension):
+        sheet_name, (first_column, first_row), (last_column, last_row) = self._parse_range(cells_range)
+        rows = self.sheets[sheet_name]
+        if first_column < 0:
+            return {"range": cells_range, "values": rows[first_row: (last_row or first_row) + 1]}
+        column = [row[first_column] if first_column < len(row) else "" for row in rows[first_row: None if last_row is None else last_row + 1]]
+        while column and column[-1] == "":
+            column.pop()
+        return {"range": cells_range, "values": [column]} if column else {"range": cells_range}
+
+    def _update(self, body):
+        for data in body["data"]:
+            sheet_name, (column, first_row), _ = self._parse_range(data["range"])
+            rows = self.sheets[sheet_name]
+            for offset, value in enumerate(data["values"][0]):
+                row = rows[first_row + offset]
+                row.extend([""] * (column + 1 - len(row)))
+                row[column] = str(value)
+                self.updated_cells += 1
+        return {}
+
+
+def make_spreadsheet(rows, sheet_count, duplicate_ratio):
+    heading = (Constants.INSTAGRAM_FILTERS + Constants.INSTAGRAM_OPTIONAL_FILTERS +
+               Constants.WHOIS_FILTERS +
+               Constants.YOUTUBE_FILTERS + Constants.YOUTUBE_OPTIONAL_FILTERS +
+               Constants.FACEBOOK_FILTERS + Constants.FACEBOOK_OPTIONAL_FILTERS)
+    unique = max(1, int(rows * (1 - duplicate_ratio)))
+    sheets = {"Sheet {0}".format(index): [list(heading)] for index in range(sheet_count)}
+    sheet_rows = list(sheets.values())
+    for index in range(rows):
+        key = index % unique
+        values = {Constants.INSTAGRAM_PAGE: "https://www.instagram.com/user{0}/".format(key),
+                  # Every fourth site is under a TLD that native lookups only reach through an IANA referral
+                  Constants.SITE_TAG: "https://site{0}.{1}".format(key, "xyz" if key % 4 == 3 else "com"),
+                  Constants.YOUTUBE_PAGE: "https://www.youtube.com/channel/UC{0}".format(key),
+                  Constants.FACEBOOK_PAGE: "https://www.facebook.com/page{0}".format(key)}
+        sheet_rows[index % sheet_count].append([values.get(column_name, "") for column_name in heading])
+    return sheets
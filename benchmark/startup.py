@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import importlib
+import subprocess
+
+from statsbot.constants import Constants
+from benchmark.offline import REPOSITORY_DIR, write_config
+from benchmark.stand_ins import CallCounter, StandInServer, WhoIsStandIn, FakeSheetsService, \
+    install_fake_libraries, make_spreadsheet
+
+HEAVY_MODULES = ["instagrapi", "facebook_scraper", "aiohttp"]
+STAND_IN_LIBRARIES = ["instagrapi", "facebook_scraper"]
+EXTRACTOR_MODULES = ["statsbot.who_is_extractor", "statsbot.instagram_extractor",
+                     "statsbot.youtube_extractor", "statsbot.facebook_extractor"]
+
+
+def make_site_spreadsheet(rows):
+    heading = list(Constants.WHOIS_FILTERS)
+    return {"Sheet 0": [heading] + [["https://site{0}.com".format(index), ""] for index in range(rows)]}
+
+
+def import_libraries():
+    # Real import cost of the libraries the stand-ins replace, None when they are not installed
+    started = time.perf_counter()
+    try:
+        for name in STAND_IN_LIBRARIES:
+            importlib.import_module(name)
+    except ImportError:
+        return None
+    return time.perf_counter() - started
+
+
+def run_child(args):
+    # Measures one start-up in a fresh interpreter, so module imports are paid again every time
+    started = time.perf_counter()
+    logging.getLogger(Constants.LOGGER_NAME).addHandler(logging.NullHandler())
+    logging.getLogger(Constants.LOGGER_NAME).propagate = False
+
+    counter = CallCounter()
+    library_seconds = None
+    if args.scenario == "all":
+        # Every extractor gets constructed here. The real libraries are imported first so the start-up pays
+        # for them, then the fake ones take their place in sys.modules and keep logins off the network
+        library_seconds = import_libraries()
+        install_fake_libraries(counter)
+    server = StandInServer(counter).start()
+
+    import application
+    imported = time.perf_counter()
+
+    discovery_started = time.perf_counter()
+    application.build('sheets', 'v4', developerKey="bench", static_discovery=True, cache_discovery=False)
+    discovery = time.perf_counter() - discovery_started
+
+    from statsbot.who_is_extractor import WhoIsExtractor
+    WhoIsExtractor.CONFIG = WhoIsStandIn.get_config(server.base_url)
+    if args.scenario == "all":
+        from statsbot.youtube_extractor import YoutubeExtractor
+        YoutubeExtractor.CHANNEL_INFO_ENDPOINT = server.base_url + "youtube/channels?part={0}&id={1}&maxResults={2}&key={3}"
+        YoutubeExtractor.PLAYLIST_ITEMS_ENDPOINT = server.base_url + \
+            "youtube/playlistItems?part=contentDetails&playlistId={0}&maxResults={1}&pageToken={2}&key={3}"
+        sheets = make_spreadsheet(args.rows, 1, 0.0)
+    else:
+        sheets = make_site_spreadsheet(args.rows)
+
+    sheets_service = FakeSheetsService(sheets, counter)
+    application.build = lambda *build_args, **build_kwargs: sheets_service
+    application.Credentials.from_service_account_file = lambda *credential_args, **credential_kwargs: None
+    write_config(args)
+
+    application.main()
+    finished = time.perf_counter()
+    server.stop()
+
+    print(json.dumps({"scenario": args.scenario,
+                      "import_seconds": imported - started,
+                      "library_seconds": library_seconds,
+                      "discovery_seconds": discovery,
+                      "total_seconds": finished - started,
+                      "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules]}))
+
+
+def measure_eager_imports(environment):
+    # What every start-up paid before extractors were loaded on demand
+    command = [sys.executable, "-c",
+               "import time; started = time.perf_counter(); import application, {0}; "
+               "print(time.perf_counter() - started)".format(", ".join(EXTRACTOR_MODULES))]
+    output = subprocess.run(command, cwd=REPOSITORY_DIR, env=environment, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def run_parent(args):
+    environment = dict(os.environ, PYTHONPATH=REPOSITORY_DIR, PYTHONDONTWRITEBYTECODE="1")
+    print("{0:>10} {1:>10} {2:>11} {3:>12} {4:>10}  {5}".format("scenario", "import s", "libraries s",
+                                                                 "discovery s", "total s", "heavy modules imported"))
+    for scenario in args.scenarios.split(","):
+        results = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as work_dir:
+                command = [sys.executable, "-m", "benchmark.startup", "--child",
+                           "--scenario", scenario,
+                           "--rows", str(args.rows)]
+                output = subprocess.run(command, cwd=work_dir, env=environment, check=True,
+                                        stdout=subprocess.PIPE, universal_newlines=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        best = min(results, key=lambda result: result["total_seconds"])
+        # Without the real libraries the "all" start-up only imported the stand-ins
+        if best["library_seconds"] is not None:
+            libraries = "{0:.3f}".format(best["library_seconds"])
+        else:
+            libraries = "stubbed" if scenario == "all" else "-"
+        print("{0:>10} {1:>10.3f} {2:>11} {3:>12.3f} {4:>10.3f}  {5}".format(scenario, best["import_seconds"],
+                                                                            libraries, best["discovery_seconds"],
+                                                                            best["total_seconds"],
+                                                                            ", ".join(best["heavy_modules"]) or "-"))
+    print("Importing every extractor with the installed libraries: {0:.3f}s".format(
+        min(measure_eager_imports(environment) for _ in range(args.repeat))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure application start-up for sheets mapping some or all platforms")
+    parser.add_argument("--scenarios", default="site,all", help="comma separated: site (only site columns), all")
+    parser.add_argument("--rows", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the fastest one is reported")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.mode = "0"
+        args.threadpool_size = 1
+        args.concurrency = 1
+        args.whois_mode = "html"
+        run_child(args)
+    else:
+        run_parent(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import os
+import re
+import json
+import time
+import argparse
+
+from statsbot.constants import Constants
+from statsbot.who_is_extractor import WhoIsExtractor
+from statsbot.whois_parser import WhoIsParser
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "whois_corpus")
+
+LEGACY_YEAR_REGEXP = re.compile(r"^.*(\d{4})[-,.]\d{2}[-,.]\d{2}.*$", re.MULTILINE)
+
+
+def legacy_parse(data, tags):
+    # The text scan WhoIsExtractor used before WhoIsParser, including the decode requests did for response.text
+    text = data.decode("utf-8", errors="replace")
+    raw_data_position = 0
+    for search_tag in tags:
+        raw_data_position = text.find(search_tag)
+        if raw_data_position > 0:
+            break
+    if raw_data_position <= 0:
+        return None
+
+    search_tag_position = text.find("reat", raw_data_position)
+    while search_tag_position > -1:
+        if text[search_tag_position - 1] == "c" or text[search_tag_position - 1] == "C":
+            match = re.search(LEGACY_YEAR_REGEXP, text[search_tag_position: search_tag_position + 50])
+            if match:
+                return int(match[1])
+        search_tag_position = text.find("reat", search_tag_position + 4)
+    return Constants.UNKNOWN_YEAR
+
+
+def measure(parse, data, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = parse(data)
+    return result, (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse time per page of saved WhoIs provider responses")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(os.path.join(CORPUS_DIR, "expected.json"), encoding="utf-8") as f:
+        cases = json.load(f)
+
+    print("{0:<28} {1:>8} {2:>9} {3:>11} {4:>9} {5:>11} {6:>8}".format(
+        "page", "KB", "expected", "legacy", "legacy us", "parser", "parser us"))
+    total_legacy = 0.0
+    total_parser = 0.0
+    failures = 0
+    for name, case in cases.items():
+        with open(os.path.join(CORPUS_DIR, name), "rb") as f:
+            data = f.read()
+        provider = WhoIsExtractor.CONFIG[case["provider"]]
+        tags = provider["tags"]
+        whois_parser = WhoIsParser(tags, provider.get("end"))
+
+        legacy_year, legacy_time = measure(lambda page: legacy_parse(page, tags), data, args.repeat)
+        year, parser_time = measure(whois_parser.parse, data, args.repeat)
+        total_legacy += legacy_time
+        total_parser += parser_time
+        failures += int(year != case["year"])
+        print("{0:<28} {1:>8.1f} {2:>9} {3:>11} {4:>9.1f} {5:>11} {6:>8.1f}{7}".format(
+            name, len(data) / 1024.0, str(case["year"]), str(legacy_year), legacy_time * 1e6,
+            str(year), parser_time * 1e6, "" if year == case["year"] else "  MISMATCH"))
+
+    print("Total per corpus pass: legacy {0:.1f} us, parser {1:.1f} us, {2:.1f}x".format(
+        total_legacy * 1e6, total_parser * 1e6, total_legacy / total_parser))
+    if failures:
+        raise SystemExit("{0} page(s) parsed to an unexpected year".format(failures))
+
+
+if __name__ == '__main__':
+    main()
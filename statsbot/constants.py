@@ -2,8 +2,17 @@ import logging
 
 
 class Constants:
+    WHOIS_PLATFORM = "whois"
+    INSTAGRAM_PLATFORM = "instagram"
+    FACEBOOK_PLATFORM = "facebook"
+    YOUTUBE_PLATFORM = "youtube"
+
+    ADDITIONAL_POST_WINDOWS = [7, 90]
+
     SITE_TAG = "site"
     SITE_YEAR_TAG = "site_year"
+    # Site year of a domain whose registry answered without a creation date
+    UNKNOWN_YEAR = -1
 
     WHOIS_FILTERS = [SITE_TAG,
                      SITE_YEAR_TAG]
@@ -11,6 +20,7 @@ class Constants:
     INSTAGRAM_PAGE = "insta_page"
     INSTAGRAM_POST_COUNT = "insta_post_count"
     INSTAGRAM_FOLLOWERS = "insta_followers"
+    INSTAGRAM_POST_LAST_DAYS_COUNT = "insta_{0}_days_count"
     INSTAGRAM_POST_LAST_N_DAYS_COUNT = "insta_30_days_count"
     INSTAGRAM_POST_LAST_DATE = "insta_last_post_date"
 
@@ -20,9 +30,12 @@ class Constants:
                          INSTAGRAM_POST_LAST_N_DAYS_COUNT,
                          INSTAGRAM_POST_LAST_DATE]
 
+    INSTAGRAM_OPTIONAL_FILTERS = list(map(INSTAGRAM_POST_LAST_DAYS_COUNT.format, ADDITIONAL_POST_WINDOWS))
+
     FACEBOOK_PAGE = "fb_page"
     FACEBOOK_POST_COUNT = "fb_post_count"
     FACEBOOK_FOLLOWERS = "fb_followers"
+    FACEBOOK_POST_LAST_DAYS_COUNT = "fb_{0}_days_count"
     FACEBOOK_POST_LAST_N_DAYS_COUNT = "fb_30_days_count"
     FACEBOOK_POST_LAST_DATE = "fb_last_post_date"
 
@@ -32,9 +45,12 @@ class Constants:
                         FACEBOOK_POST_LAST_N_DAYS_COUNT,
                         FACEBOOK_POST_LAST_DATE]
 
+    FACEBOOK_OPTIONAL_FILTERS = list(map(FACEBOOK_POST_LAST_DAYS_COUNT.format, ADDITIONAL_POST_WINDOWS))
+
     YOUTUBE_PAGE = "youtube_page"
     YOUTUBE_POST_COUNT = "youtube_video_count"
     YOUTUBE_FOLLOWERS = "youtube_followers"
+    YOUTUBE_POST_LAST_DAYS_COUNT = "youtube_{0}_days_count"
     YOUTUBE_POST_LAST_N_DAYS_COUNT = "youtube_30_days_count"
     YOUTUBE_POST_LAST_DATE = "youtube_last_video_date"
 
@@ -44,6 +60,8 @@ class Constants:
                        YOUTUBE_POST_LAST_N_DAYS_COUNT,
                        YOUTUBE_POST_LAST_DATE]
 
+    YOUTUBE_OPTIONAL_FILTERS = list(map(YOUTUBE_POST_LAST_DAYS_COUNT.format, ADDITIONAL_POST_WINDOWS))
+
     LOG_LEVEL = logging.DEBUG
     LOG_MAX_FILE_SIZE = 5 * 1024 * 1024
     LOG_MAX_FILE_COUNT = 5
@@ -53,15 +71,45 @@ class Constants:
     LOGGER_NAME = "StatsBot"
 
     SPREADSHEET_SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+    SHEET_FIRST_DATA_ROW = 2
+    SHEETS_MAX_REQUEST_SIZE = 2 * 1024 * 1024
+    PIPELINE_SHEETS = 5
+    PIPELINE_READ_QUEUE_SIZE = 2
+    PIPELINE_WRITE_QUEUE_SIZE = 10000
+    PIPELINE_WRITE_ROWS = 5000
+    SHARD_LEASE_TTL = 30 * 60
+    SHARD_RUN_TTL = 7 * 24 * 60 * 60
+    SHARD_RUN_ID_FORMAT = "%Y-%m-%d"
+    SHARD_DATABASE_TIMEOUT = 30
+    INSTAGRAM_ID_QUERY_SIZE = 500
+    INSTAGRAM_ID_DATABASE_TIMEOUT = 30
+    METRICS_RESERVOIR_SIZE = 10000
+    SERVER_STATS_PATH = "/stats"
+    SERVER_DEFAULT_HOST = "0.0.0.0"
+    SERVER_DEFAULT_PORT = 8080
+    SERVER_MAX_JOBS = 20
+    SERVER_MAX_WAIT = 50
+    DAEMON_DEFAULT_INTERVAL = 24 * 60
+    HTTP_DEFAULT_POOL_SIZE = 10
+    HTTP_MAX_HOSTS = 32
+    HTTP_CONNECT_TIMEOUT = 5
+    HTTP_READ_TIMEOUT = 30
+    HTTP_MAX_RETRIES = 2
+    HTTP_RETRY_BACKOFF = 0.5
+    HTTP_RETRY_STATUS_CODES = (500, 502, 503, 504)
+    HTTP_DNS_CACHE_TTL = 300
 
     CONFIG_FILE = "config.txt"
     CREDENTIALS_DIR = "credentials"
+    CACHE_DIR = "cache"
+    METRICS_DIR = "metrics"
     CREDENTIALS_FILE = "credentials.json"
     TOKEN_FILE = "token.json"
     COOKIE_FILE = "facebook_cookies.json"
 
     CONFIG_INSTAGRAM_USERNAME = "instagram_username"
     CONFIG_INSTAGRAM_PASSWORD = "instagram_password"
+    CONFIG_INSTAGRAM_ACCOUNTS = "instagram_accounts"
     CONFIG_FACEBOOK_USERNAME = "facebook_username"
     CONFIG_FACEBOOK_PASSWORD = "facebook_password"
     CONFIG_INSTAGRAM_SLEEP_TIMEOUT = "instagram_sleep_timeout"
@@ -69,12 +117,60 @@ class Constants:
     CONFIG_YOUTUBE_TOKEN = "youtube_token"
     CONFIG_THREADPOOL_SIZE = "threadpool_size"
     CONFIG_RUN_IN_PARALLEL = "run_in_parallel"
+    CONFIG_WHOIS_NEGATIVE_TTL = "whois_negative_ttl"
+    CONFIG_WHOIS_HEDGE_DELAY = "whois_hedge_delay"
+    CONFIG_WHOIS_MODE = "whois_mode"
+    CONFIG_FACEBOOK_FULL_RESCAN = "facebook_full_rescan"
+    CONFIG_FACEBOOK_FULL_RESCAN_INTERVAL = "facebook_full_rescan_interval"
+    CONFIG_PIPELINE_SHEETS = "pipeline_sheets"
+    CONFIG_SHARD_DATABASE = "shard_database"
+    CONFIG_METRICS_DIR = "metrics_dir"
+    CONFIG_SERVER_HOST = "server_host"
+    CONFIG_SERVER_PORT = "server_port"
+    CONFIG_DAEMON_INTERVAL = "daemon_interval"
+    CONFIG_HTTP_POOL_SIZE = "http_pool_size"
+    CONFIG_FRESHNESS = "freshness_{0}"
+    CONFIG_CONCURRENCY = "{0}_concurrency"
+    CONFIG_RATE = "{0}_rate"
+    CONFIG_BURST = "{0}_burst"
+
+    RUN_MODE_SEQUENTIAL = "one-thread"
+    RUN_MODE_PARALLEL = "parallel"
+    RUN_MODE_ASYNC = "async"
+
+    DEFAULT_CONCURRENCY = {WHOIS_PLATFORM: 20,
+                           INSTAGRAM_PLATFORM: 1,
+                           FACEBOOK_PLATFORM: 2,
+                           YOUTUBE_PLATFORM: 50}
 
     INSTAGRAM_USER_SESSION_FILE = "instagram_{0}.json"
     INSTAGRAM_ID_FILE = "instagram_user_to_id.json"
+    INSTAGRAM_ID_DATABASE = "instagram_user_to_id.sqlite"
+    WHOIS_CACHE_FILE = "whois_cache.json"
+    YOUTUBE_CACHE_FILE = "youtube_channels.json"
+    FACEBOOK_WATERMARK_FILE = "facebook_watermarks.json"
+    POST_INDEX_FILE = "{0}_post_index.json"
+    JOURNAL_FILE = "journal.jsonl"
+    SHARD_DATABASE_FILE = "shard_leases.sqlite"
+    SHARD_JOURNAL_FILE = "journal_shard_{0}_of_{1}.jsonl"
+    METRICS_REPORT_FILE = "run_report.json"
+    METRICS_PROMETHEUS_FILE = "statsbot.prom"
+    FRESHNESS_FILE = "freshness.json"
+
+    WHOIS_DEFAULT_NEGATIVE_TTL = 72
+    WHOIS_REQUEST_TIMEOUT = 15
+    WHOIS_MAX_REFERRALS = 2
+    WHOIS_READ_SIZE = 4096
+    WHOIS_MAX_RESPONSE_SIZE = 64 * 1024
+    WHOIS_MODE_HTML = "html"
+    WHOIS_MODE_NATIVE = "native"
 
     LAST_N_DAYS = 30
+    POST_WINDOWS = sorted(ADDITIONAL_POST_WINDOWS + [LAST_N_DAYS])
     SINGLE_REQUEST_POST_COUNT = LAST_N_DAYS
     FACEBOOK_MAX_POSTS_PER_PAGE = 200
+    FACEBOOK_DEFAULT_FULL_RESCAN_INTERVAL = 30
+    FACEBOOK_PINNED_POSTS_TOLERANCE = 3
+    INSTAGRAM_PINNED_POSTS_TOLERANCE = 3
 
 
@@ -1,14 +1,55 @@
+import asyncio
 from abc import ABC, abstractmethod
 
 
 class Extractor(ABC):
+    PLATFORM = ""
+    NATIVE_ASYNC = False
+    BATCH_SIZE = 0
+    FIELDS = []
+
+    rate_limiter = None
 
     @abstractmethod
     def get_stats(self, user):
         pass
 
+    def get_key(self, user):
+        # Normalized lookup key: rows sharing a key are fetched once, an empty key means nothing to fetch
+        # and None opts the row out of deduplication
+        return None
+
+    def prepare(self, keys):
+        # Called with the keys about to be looked up, before any of them is fetched
+        pass
+
+    async def get_stats_async(self, user):
+        # Adapter for blocking libraries: the call runs on the event loop's default executor
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_stats, user)
+
+    def get_stats_batch(self, users):
+        return [self.get_stats(user) for user in users]
+
+    async def get_stats_batch_async(self, users):
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_stats_batch, users)
+
+    async def on_start_async(self):
+        pass
+
+    async def on_stop_async(self):
+        pass
+
     def is_working(self):
         return True
 
-    def on_stop(self):
+    def get_session_count(self):
+        return 1
+
+    def get_rate_limits(self):
+        return [self.rate_limiter.get_rates()] if self.rate_limiter else []
+
+    def flush(self):
         pass
+
+    def on_stop(self):
+        self.flush()
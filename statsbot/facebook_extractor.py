@@ -1,22 +1,42 @@
 import os
+import time
 import logging
 import datetime
 
 from statsbot.constants import Constants
 from statsbot.extractor import Extractor
+from statsbot.json_store import JsonStore
+from statsbot.post_index import PostIndex
+from statsbot.rate_limiter import RateLimiter
 
 from facebook_scraper import get_posts
 from facebook_scraper import set_cookies
 from facebook_scraper import get_page_info
+from facebook_scraper.exceptions import TemporarilyBanned
 
 
 class FacebookExtractor(Extractor):
+    PLATFORM = Constants.FACEBOOK_PLATFORM
+    FIELDS = Constants.FACEBOOK_FILTERS[1:] + Constants.FACEBOOK_OPTIONAL_FILTERS
 
     def __init__(self, config):
         self.logger = logging.getLogger(Constants.LOGGER_NAME)
         self.config = config
+        self.rate_limiter = RateLimiter.from_config(self.PLATFORM, self.config, (TemporarilyBanned,))
+        self.watermarks = JsonStore(Constants.FACEBOOK_WATERMARK_FILE)
+        self.post_index = PostIndex(self.PLATFORM)
+        self.full_rescan = bool(int(self.config.get(Constants.CONFIG_FACEBOOK_FULL_RESCAN, 0)))
+        self.full_rescan_interval = float(self.config.get(Constants.CONFIG_FACEBOOK_FULL_RESCAN_INTERVAL,
+                                                          Constants.FACEBOOK_DEFAULT_FULL_RESCAN_INTERVAL)) * 86400
         set_cookies(os.path.join(Constants.CREDENTIALS_DIR, Constants.COOKIE_FILE))
 
+    def flush(self):
+        self.watermarks.store()
+        self.post_index.flush()
+
+    def get_key(self, user):
+        return self._extract_page_name(user.get(Constants.FACEBOOK_PAGE, "")).lower()
+
     def get_stats(self, user):
         updated_user = {}
         if not self.is_working():
@@ -30,28 +50,53 @@ class FacebookExtractor(Extractor):
             page_name = self._extract_page_name(user[Constants.FACEBOOK_PAGE])
             self.logger.debug("Requesting statistics for Facebook page, id: %s", page_name)
 
-            page_info = get_page_info(page_name)
+            with self.rate_limiter:
+                page_info = get_page_info(page_name)
             updated_user[Constants.FACEBOOK_FOLLOWERS] = int(page_info["followers"])
 
-            post_count = 0
-            last_n_days_post_count = 0
-
-            last_n_days = datetime.datetime.now() - datetime.timedelta(days=Constants.LAST_N_DAYS)
-            last_post_date = datetime.datetime.strptime("2000-01-01 00:00:00", "%Y-%m-%d %H:%M:%S")
+            watermark = self._get_watermark(page_name)
+            newest_post_time = self._parse_time(watermark["newest_post_time"]) if watermark else None
+            if watermark:
+                self.logger.debug("Scanning Facebook page '%s' for posts newer than %s",
+                                  page_name, watermark["newest_post_time"])
 
+            new_posts = []
+            older_post_count = 0
             credentials = [self.config[Constants.CONFIG_FACEBOOK_USERNAME],
                            self.config[Constants.CONFIG_FACEBOOK_PASSWORD]]
             options = {"allow_extra_requests": False,
                        "posts_per_page": Constants.FACEBOOK_MAX_POSTS_PER_PAGE}
-            for post in get_posts(page_name, pages=None, options=options, credentials=credentials):
-                post_count += 1
-                if post['time'] > last_post_date:
-                    last_post_date = post['time']
-                if post['time'] > last_n_days:
-                    last_n_days_post_count += 1
+            with self.rate_limiter:
+                for post in get_posts(page_name, pages=None, options=options, credentials=credentials):
+                    if watermark and (post['post_id'] == watermark["newest_post_id"] or post['time'] <= newest_post_time):
+                        # Pinned posts may precede newer ones, the watermark post itself included,
+                        # so only stop after a few known posts in a row
+                        older_post_count += 1
+                        if older_post_count >= Constants.FACEBOOK_PINNED_POSTS_TOLERANCE:
+                            break
+                        continue
+                    older_post_count = 0
+                    new_posts.append(post)
+
+            post_count = len(new_posts) + (watermark["post_count"] if watermark else 0)
+            self.post_index.add(page_name, [post['time'] for post in new_posts], replace=not watermark)
 
+            last_post_date = datetime.datetime.strptime("2000-01-01 00:00:00", "%Y-%m-%d %H:%M:%S")
+            newest_post = max(new_posts, key=lambda post: post['time'], default=None)
+            if newest_post:
+                last_post_date = max(newest_post['time'], newest_post_time or last_post_date)
+            elif newest_post_time:
+                last_post_date = newest_post_time
+
+            self.watermarks.set(page_name, {
+                "post_count": post_count,
+                "newest_post_id": newest_post['post_id'] if newest_post and newest_post['time'] == last_post_date
+                else (watermark or {}).get("newest_post_id", ""),
+                "newest_post_time": str(last_post_date),
+                "full_scan_time": watermark["full_scan_time"] if watermark else time.time()})
+
+            updated_user.update(self.post_index.get_window_counts(page_name, Constants.FACEBOOK_POST_LAST_DAYS_COUNT))
             updated_user[Constants.FACEBOOK_POST_COUNT] = post_count
-            updated_user[Constants.FACEBOOK_POST_LAST_N_DAYS_COUNT] = last_n_days_post_count
             updated_user[Constants.FACEBOOK_POST_LAST_DATE] = str(last_post_date)
 
             self.logger.debug("Facebook page '%s' processed: followers %d, post total %d, last %d days %d, last date %s",
@@ -66,6 +111,18 @@ class FacebookExtractor(Extractor):
             self.logger.warning(e)
         return updated_user
 
+    def _get_watermark(self, page_name):
+        watermark = self.watermarks.get(page_name)
+        if not watermark or self.full_rescan or time.time() - watermark["full_scan_time"] > self.full_rescan_interval:
+            return None
+        if watermark["post_count"] and self.post_index.get_newest(page_name) is None:
+            self.logger.debug("No indexed posts for Facebook page '%s', rescanning it", page_name)
+            return None
+        return watermark
+
+    def _parse_time(self, post_time):
+        return datetime.datetime.fromisoformat(post_time)
+
     def _extract_page_name(self, url):
         if not url:
             return ""
@@ -0,0 +1,80 @@
+import time
+import logging
+
+from statsbot.constants import Constants
+from statsbot.json_store import JsonStore
+
+
+class Freshness:
+    NEVER = "never"
+    DEFAULT = "default"
+
+    def __init__(self, config):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        # FRESHNESS_<FIELD>=hours, either for one column (FRESHNESS_INSTA_FOLLOWERS) or for the column
+        # without its platform prefix (FRESHNESS_FOLLOWERS), FRESHNESS_DEFAULT covers the other columns
+        # and "never" keeps a fetched value forever
+        prefix = Constants.CONFIG_FRESHNESS.format("")
+        self.policies = {}
+        for name, value in config.items():
+            if name.startswith(prefix) and value:
+                self.policies[name[len(prefix):]] = float("inf") if value.lower() == self.NEVER \
+                    else float(value) * 3600
+        self.store = JsonStore(Constants.FRESHNESS_FILE)
+        # Touches wait here until the run that made them has been written back
+        self.pending = {}
+        self.fresh_count = 0
+        self.stale_count = 0
+        if self.policies:
+            self.logger.info("Freshness policies: %s",
+                             str({field: ttl / 3600 for field, ttl in self.policies.items()}))
+
+    def get_ttl(self, field):
+        ttl = self.policies.get(field)
+        if ttl is None:
+            ttl = self.policies.get(field.partition("_")[2], self.policies.get(self.DEFAULT, 0))
+        return ttl
+
+    def is_fresh(self, platform, key, users, fields):
+        # A lookup is skipped only when every column it would fill already holds a value fetched recently enough
+        if not self.policies:
+            return False
+        fetched = self.store.get(self._get_key(platform, key), {})
+        now = time.time()
+        fresh = True
+        for field in fields:
+            if not any(field in user for user in users):
+                continue
+            if any(str(user.get(field, "")) == "" for user in users) or \
+                    now - fetched.get(field, 0) >= self.get_ttl(field):
+                fresh = False
+                break
+        if fresh:
+            self.fresh_count += 1
+        else:
+            self.stale_count += 1
+        return fresh
+
+    def touch(self, platform, key, fields):
+        if self.policies and fields:
+            now = time.time()
+            self.pending.setdefault(self._get_key(platform, key), {}).update((field, now) for field in fields)
+
+    def discard(self):
+        # A value that never reached the sheet must not keep the next run from fetching it again
+        if self.pending:
+            self.logger.info("Freshness: %d lookup(s) not written back, dropped", len(self.pending))
+        self.pending = {}
+
+    def flush(self):
+        for key, fields in self.pending.items():
+            self.store.update(key, **fields)
+        self.pending = {}
+        if self.policies:
+            self.logger.info("Freshness: %d lookup(s) skipped as fresh, %d stale", self.fresh_count, self.stale_count)
+            self.store.store()
+        self.fresh_count = 0
+        self.stale_count = 0
+
+    def _get_key(self, platform, key):
+        return "{0}:{1}".format(platform, key)
@@ -0,0 +1,172 @@
+import time
+import random
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from statsbot.constants import Constants
+from statsbot.metrics import Metrics
+
+# Set by the pools below whenever a request has to open a new connection instead of reusing a pooled one
+_connection_state = threading.local()
+
+
+class HttpStatusError(Exception):
+
+    def __init__(self, url, status):
+        super().__init__("HTTP {0} from {1}".format(status, url))
+        self.url = url
+        self.status = status
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+
+    def _new_conn(self):
+        _connection_state.created = True
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+
+    def _new_conn(self):
+        _connection_state.created = True
+        return super()._new_conn()
+
+
+class _PooledAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _CountingHTTPConnectionPool,
+                                                   "https": _CountingHTTPSConnectionPool}
+
+
+class HttpClient:
+    # One keep-alive connection pool per host shared by every extractor, blocking and asyncio alike
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pool_size = 0
+        self.session = requests.Session()
+        self.async_session = None
+        self.async_users = 0
+        self.host_stats = {}
+        self._mount(Constants.HTTP_DEFAULT_POOL_SIZE)
+
+    @classmethod
+    def get(cls, config=None):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            if config is not None:
+                cls._instance.configure(config)
+            return cls._instance
+
+    def configure(self, config):
+        # Every worker thread of the busiest extractor must be able to hold a connection to the same host
+        pool_size = int(config.get(Constants.CONFIG_HTTP_POOL_SIZE, 0))
+        if not pool_size:
+            pool_size = max([int(config.get(Constants.CONFIG_THREADPOOL_SIZE, 1))] +
+                            [int(config.get(Constants.CONFIG_CONCURRENCY.format(platform), concurrency))
+                             for platform, concurrency in Constants.DEFAULT_CONCURRENCY.items()])
+        if pool_size != self.pool_size:
+            self._mount(pool_size)
+
+    def _mount(self, pool_size):
+        with self.lock:
+            self.pool_size = pool_size
+            adapter = _PooledAdapter(pool_connections=Constants.HTTP_MAX_HOSTS, pool_maxsize=pool_size, max_retries=0)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+    def fetch(self, url, headers=None, timeout=None, retries=Constants.HTTP_MAX_RETRIES):
+        # Returns status code and body, connection errors are raised once the retries are used up
+        host = urlsplit(url).netloc
+        timeout = timeout or (Constants.HTTP_CONNECT_TIMEOUT, Constants.HTTP_READ_TIMEOUT)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            _connection_state.created = False
+            try:
+                response = self.session.get(url, headers=headers, timeout=timeout)
+                status, body = response.status_code, response.content
+            except requests.RequestException:
+                self._record(host, started, _connection_state.created, attempt, 0, True)
+                if attempt >= retries:
+                    raise
+            else:
+                self._record(host, started, _connection_state.created, attempt, len(body),
+                             status in Constants.HTTP_RETRY_STATUS_CODES)
+                if status not in Constants.HTTP_RETRY_STATUS_CODES or attempt >= retries:
+                    return status, body
+            time.sleep(self._get_backoff(attempt))
+            attempt += 1
+
+    async def start_async(self):
+        # Extractors share one aiohttp session per run, the last one to stop closes it
+        if self.async_session is None:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._on_connection_created)
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_size,
+                                             ttl_dns_cache=Constants.HTTP_DNS_CACHE_TTL)
+            self.async_session = aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+        self.async_users += 1
+
+    async def stop_async(self):
+        self.async_users -= 1
+        if self.async_users <= 0 and self.async_session is not None:
+            await self.async_session.close()
+            self.async_session = None
+            self.async_users = 0
+
+    async def fetch_async(self, url, headers=None, timeout=None, retries=Constants.HTTP_MAX_RETRIES):
+        host = urlsplit(url).netloc
+        timeout = aiohttp.ClientTimeout(total=timeout, connect=Constants.HTTP_CONNECT_TIMEOUT,
+                                        sock_read=None if timeout else Constants.HTTP_READ_TIMEOUT)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            trace = {"created": False}
+            try:
+                async with self.async_session.get(url, headers=headers, timeout=timeout,
+                                                  trace_request_ctx=trace) as response:
+                    status, body = response.status, await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self._record(host, started, trace["created"], attempt, 0, True)
+                if attempt >= retries:
+                    raise
+            else:
+                self._record(host, started, trace["created"], attempt, len(body),
+                             status in Constants.HTTP_RETRY_STATUS_CODES)
+                if status not in Constants.HTTP_RETRY_STATUS_CODES or attempt >= retries:
+                    return status, body
+            await asyncio.sleep(self._get_backoff(attempt))
+            attempt += 1
+
+    async def _on_connection_created(self, session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx["created"] = True
+
+    def _get_backoff(self, attempt):
+        # Full jitter keeps concurrent workers that failed together from retrying together
+        return random.uniform(0, Constants.HTTP_RETRY_BACKOFF * 2 ** attempt)
+
+    def _record(self, host, started, created, attempt, size, failed):
+        with self.lock:
+            stats = self.host_stats.setdefault(host, {"requests": 0, "connections": 0})
+            stats["requests"] += 1
+            stats["connections"] += int(created)
+        Metrics.get().record("http", time.perf_counter() - started, error=failed, retries=int(attempt > 0),
+                             size=size, host=host, connection="new" if created else "reused")
+
+    def get_connection_stats(self):
+        with self.lock:
+            return {host: dict(stats, reused=stats["requests"] - stats["connections"])
+                    for host, stats in self.host_stats.items()}
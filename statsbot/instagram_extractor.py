@@ -1,71 +1,87 @@
-import json
 import logging
-import time
 import os.path
+import time
 import datetime
+import threading
 
 from statsbot.constants import Constants
 from statsbot.extractor import Extractor
+from statsbot.instagram_id_store import InstagramIdStore
+from statsbot.instagram_session import InstagramSession
+from statsbot.post_index import PostIndex
 
-from instagrapi import Client
+from instagrapi.exceptions import ClientThrottledError, PleaseWaitFewMinutes, RateLimitError, LoginRequired, \
+    ChallengeRequired
 
 
 class InstagramExtractor(Extractor):
+    PLATFORM = Constants.INSTAGRAM_PLATFORM
+    FIELDS = Constants.INSTAGRAM_FILTERS[1:] + Constants.INSTAGRAM_OPTIONAL_FILTERS
+
+    THROTTLE_ERRORS = (ClientThrottledError, PleaseWaitFewMinutes, RateLimitError)
 
     def __init__(self, config):
         self.logger = logging.getLogger(Constants.LOGGER_NAME)
         self.config = config
-        self.new_id_resolved = False
-        self.name_to_id = {}
-        self.cred_file = os.path.join(Constants.CREDENTIALS_DIR,
-                                      Constants.INSTAGRAM_USER_SESSION_FILE.format(
-                                          self.config[Constants.CONFIG_INSTAGRAM_USERNAME]))
-
-        error_message = ""
-        try:
-            self.instagrapi = Client()
-            if os.path.exists(self.cred_file):
-                self.instagrapi.load_settings(self.cred_file)
-            self.login_success = self.instagrapi.login(self.config[Constants.CONFIG_INSTAGRAM_USERNAME],
-                                                       self.config[Constants.CONFIG_INSTAGRAM_PASSWORD])
-
-            self._load_id_file()
-        except Exception as e:
-            self.login_success = False
-            error_message = str(e)
-
-        if not self.login_success:
-            self.logger.error("Failed to login to Instagram: %s", error_message)
-            return
+        self.sessions_lock = threading.Lock()
+        self.post_index = PostIndex(self.PLATFORM)
 
-        self.instagrapi.dump_settings(self.cred_file)
+        self.id_store = InstagramIdStore(os.path.join(Constants.CREDENTIALS_DIR, Constants.INSTAGRAM_ID_DATABASE),
+                                         os.path.join(Constants.CREDENTIALS_DIR, Constants.INSTAGRAM_ID_FILE))
 
-        if Constants.CONFIG_INSTAGRAM_SLEEP_TIMEOUT not in self.config:
-            self.logger.info("No request timeout configured for Instagram parser")
-            self.config[Constants.CONFIG_INSTAGRAM_SLEEP_TIMEOUT] = 0
-        else:
-            self.config[Constants.CONFIG_INSTAGRAM_SLEEP_TIMEOUT] = int(
-                self.config[Constants.CONFIG_INSTAGRAM_SLEEP_TIMEOUT])
-            self.logger.info("Request timeout for Instagram parser is configured to %d seconds",
-                             self.config[Constants.CONFIG_INSTAGRAM_SLEEP_TIMEOUT])
-
-    def _load_id_file(self):
-        self.name_to_id = {}
-        if os.path.exists(os.path.join(Constants.CREDENTIALS_DIR, Constants.INSTAGRAM_ID_FILE)):
-            with open(os.path.join(Constants.CREDENTIALS_DIR, Constants.INSTAGRAM_ID_FILE), 'r') as f:
-                self.name_to_id = json.load(f)
-
-    def _store_id_file(self):
-        if self.new_id_resolved:
-            with open(os.path.join(Constants.CREDENTIALS_DIR, Constants.INSTAGRAM_ID_FILE), 'w', encoding='utf-8') as f:
-                json.dump(self.name_to_id, f, ensure_ascii=False, indent=4)
-            self.new_id_resolved = False
+        self._init_rate_limit_config()
+        self.sessions = [InstagramSession(username, password, self.config, self.THROTTLE_ERRORS)
+                         for username, password in self._get_accounts()]
+        for session in self.sessions:
+            session.login()
+        if not self.is_working():
+            self.logger.error("Failed to login to Instagram: no account available")
+            return
+
+        self.logger.info("Instagram parser uses %d of %d account(s), each limited to %s",
+                         self.get_session_count(), len(self.sessions), str(self.get_rate_limits()[0]))
+
+    def _get_accounts(self):
+        # INSTAGRAM_ACCOUNTS adds comma separated username:password pairs to the main account
+        accounts = [(self.config[Constants.CONFIG_INSTAGRAM_USERNAME], self.config[Constants.CONFIG_INSTAGRAM_PASSWORD])]
+        for account in self.config.get(Constants.CONFIG_INSTAGRAM_ACCOUNTS, "").split(","):
+            username, _, password = account.strip().partition(":")
+            if username and username not in [known_username for known_username, _ in accounts]:
+                accounts.append((username, password))
+        return accounts
+
+    def _init_rate_limit_config(self):
+        rate_key = Constants.CONFIG_RATE.format(self.PLATFORM)
+        sleep_timeout = int(self.config.get(Constants.CONFIG_INSTAGRAM_SLEEP_TIMEOUT, 0))
+        if rate_key not in self.config and sleep_timeout > 0:
+            # Legacy setting: one request every INSTAGRAM_SLEEP_TIMEOUT seconds
+            self.config[rate_key] = 1 / sleep_timeout
 
     def is_working(self):
-        return self.login_success
+        return any(session.healthy for session in self.sessions)
+
+    def get_session_count(self):
+        return len([session for session in self.sessions if session.healthy])
+
+    def get_rate_limits(self):
+        return [session.rate_limiter.get_rates() for session in self.sessions if session.healthy]
+
+    def prepare(self, keys):
+        new_usernames = self.id_store.preload(keys)
+        self.logger.info("Instagram ids: %d handle(s) known, %d new to resolve",
+                         len(keys) - len(new_usernames), len(new_usernames))
+
+    def flush(self):
+        for session in self.sessions:
+            session.log_stats()
+        self.post_index.flush()
 
     def on_stop(self):
-        self._store_id_file()
+        self.flush()
+        self.id_store.close()
+
+    def get_key(self, user):
+        return self._extract_username(user.get(Constants.INSTAGRAM_PAGE, "")).lower()
 
     def get_stats(self, user):
         updated_user = {}
@@ -73,69 +89,119 @@ class InstagramExtractor(Extractor):
             self.logger.error("Skip collecting Instagram statistics: login failure")
             return updated_user
 
-        try:
-            updated_user = self.get_post_stats(user)
-        except Exception as e:
-            self.logger.warning("Failed to collect stats for Instagram user '%s'",
-                                self._extract_username(user[Constants.INSTAGRAM_PAGE]))
-            self.logger.warning(e)
-
-        if user.get(Constants.INSTAGRAM_PAGE, "") and self.config[Constants.CONFIG_INSTAGRAM_SLEEP_TIMEOUT] > 0:
-            self.logger.debug("Waiting for %d seconds before processing next Instagram user",
-                              self.config[Constants.CONFIG_INSTAGRAM_SLEEP_TIMEOUT])
-            time.sleep(self.config[Constants.CONFIG_INSTAGRAM_SLEEP_TIMEOUT])
-
+        # Every account gets one chance, an account failing with a challenge or a lost login is rotated out
+        for _ in range(len(self.sessions) + 1):
+            session = self._acquire_session()
+            if session is None:
+                break
+            started = time.perf_counter()
+            failed = True
+            try:
+                updated_user = self.get_post_stats(user, session)
+                failed = False
+                return updated_user
+            except LoginRequired:
+                # Sessions outlive single runs in daemon mode, an expired one logs in again before it is given up
+                if not session.login(relogin=True):
+                    self._rotate_out(session, "login required")
+            except ChallengeRequired:
+                self._rotate_out(session, "challenge required")
+            except Exception as e:
+                self.logger.warning("Failed to collect stats for Instagram user '%s'",
+                                    self._extract_username(user[Constants.INSTAGRAM_PAGE]))
+                self.logger.warning(e)
+                return updated_user
+            finally:
+                self._release_session(session, started, failed)
+
+        self.logger.error("Skip collecting stats for Instagram user '%s': no healthy account left",
+                          self._extract_username(user[Constants.INSTAGRAM_PAGE]))
         return updated_user
 
-    def get_post_stats(self, user):
+    def _acquire_session(self):
+        # The least busy healthy account takes the lookup, ties go to the one that did the least so far
+        with self.sessions_lock:
+            sessions = [session for session in self.sessions if session.healthy]
+            if not sessions:
+                return None
+            session = min(sessions, key=lambda candidate: (candidate.in_flight, candidate.lookup_count))
+            session.in_flight += 1
+            return session
+
+    def _release_session(self, session, started, failed):
+        with self.sessions_lock:
+            session.in_flight -= 1
+            session.record(started, time.perf_counter(), failed)
+
+    def _rotate_out(self, session, reason):
+        session.healthy = False
+        self.logger.warning("Instagram account '%s' rotated out: %s, %d healthy account(s) left",
+                            session.username, reason, self.get_session_count())
+
+    def get_post_stats(self, user, session):
         updated_user = {}
         if not user.get(Constants.INSTAGRAM_PAGE, ""):
             return updated_user
         user_name = self._extract_username(user[Constants.INSTAGRAM_PAGE])
-        user_id = self.name_to_id.get(user_name, "")
+        user_id = self.id_store.get(user_name)
         if not user_id:
-            user_id = self.instagrapi.user_id_from_username(user_name)
-            self.name_to_id[user_name] = user_id
-            self.new_id_resolved = True
+            with session.rate_limiter:
+                user_id = session.client.user_id_from_username(user_name)
+            self.id_store.set(user_name, user_id)
             self.logger.debug("Instagram ID for user '%s' is resolved to %s", user_name, user_id)
         else:
             self.logger.debug("Instagram ID for user '%s' is already known: %s", user_name, user_id)
 
-        user_info = self.instagrapi.user_info(user_id)
+        with session.rate_limiter:
+            user_info = session.client.user_info(user_id)
 
-        last_n_days_post_count = 0
-        last_n_days = datetime.datetime.now() - datetime.timedelta(days=Constants.LAST_N_DAYS)
-        last_post_date = datetime.datetime.strptime("2000-01-01 00:00:00", "%Y-%m-%d %H:%M:%S")
+        # Only posts newer than the indexed ones are fetched, back to the largest counted window
+        newest_indexed = self.post_index.get_newest(user_name)
+        oldest_needed = self.post_index.get_oldest_needed()
+        post_times = []
 
         is_run = True
         if user_info.media_count == 0:
             self.logger.debug("No posts for Instagram user '%s'", user_name)
-            last_post_date = ""
             is_run = False
 
         end_cursor = ""
+        older_post_count = 0
         while is_run:
-            posts, end_cursor = self.instagrapi.user_medias_paginated(int(user_id),
-                                                                      Constants.SINGLE_REQUEST_POST_COUNT,
-                                                                      end_cursor)
+            with session.rate_limiter:
+                posts, end_cursor = session.client.user_medias_paginated(int(user_id),
+                                                                          Constants.SINGLE_REQUEST_POST_COUNT,
+                                                                          end_cursor)
             if not posts:
                 break
 
             self.logger.debug("Processing %d post(s) of Instagram user '%s'", len(posts), user_name)
             for post in posts:
                 post_naive_date = post.taken_at.replace(tzinfo=None)
-                if post_naive_date > last_post_date:
-                    last_post_date = post_naive_date
+                if (newest_indexed and post_naive_date <= newest_indexed) or \
+                        (post_naive_date < oldest_needed and post_times):
+                    # Pinned posts come first whatever their age, so only stop after a few old posts in a row
+                    older_post_count += 1
+                    if older_post_count >= Constants.INSTAGRAM_PINNED_POSTS_TOLERANCE:
+                        is_run = False
+                        break
+                    continue
+                older_post_count = 0
+                post_times.append(post_naive_date)
+
+            if not end_cursor:
+                break
 
-                if post_naive_date >= last_n_days:
-                    last_n_days_post_count += 1
-                else:
-                    is_run = False
-                    break
+        self.post_index.add(user_name, post_times)
+        last_post_date = self.post_index.get_newest(user_name)
+        if user_info.media_count == 0:
+            last_post_date = ""
+        elif last_post_date is None:
+            last_post_date = datetime.datetime.strptime("2000-01-01 00:00:00", "%Y-%m-%d %H:%M:%S")
 
+        updated_user.update(self.post_index.get_window_counts(user_name, Constants.INSTAGRAM_POST_LAST_DAYS_COUNT))
         updated_user[Constants.INSTAGRAM_POST_COUNT] = user_info.media_count
         updated_user[Constants.INSTAGRAM_FOLLOWERS] = user_info.follower_count
-        updated_user[Constants.INSTAGRAM_POST_LAST_N_DAYS_COUNT] = last_n_days_post_count
         updated_user[Constants.INSTAGRAM_POST_LAST_DATE] = str(last_post_date)
 
         self.logger.debug("Instagram user '%s' processed: followers %d, posts total %d, last %d days %d, last date %s",
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+
+from statsbot.constants import Constants
+
+
+class InstagramIdStore:
+
+    def __init__(self, database, json_file=None):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.resolved_count = 0
+
+        database_dir = os.path.dirname(database)
+        if database_dir and not os.path.exists(database_dir):
+            os.makedirs(database_dir)
+        # Every resolved id is committed on its own, so a crash loses nothing that was already paid for
+        self.connection = sqlite3.connect(database, timeout=Constants.INSTAGRAM_ID_DATABASE_TIMEOUT,
+                                          isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS user_ids ("
+                                "username TEXT PRIMARY KEY, "
+                                "user_id TEXT NOT NULL, "
+                                "resolved REAL NOT NULL)")
+        if json_file and os.path.exists(json_file):
+            self._migrate(json_file)
+
+    def _migrate(self, json_file):
+        # One-time import of the former JSON id file, renamed afterwards so it is never read again
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                name_to_id = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning("Failed to migrate Instagram ids from %s: %s", json_file, str(e))
+            return
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.executemany("INSERT OR IGNORE INTO user_ids (username, user_id, resolved) VALUES (?, ?, ?)",
+                                        [(self._normalize(username), str(user_id), now)
+                                         for username, user_id in name_to_id.items() if user_id])
+            self.connection.execute("COMMIT")
+        os.replace(json_file, json_file + ".migrated")
+        self.logger.info("%d Instagram id(s) migrated from %s", len(name_to_id), json_file)
+
+    def get(self, username):
+        username = self._normalize(username)
+        with self.lock:
+            user_id = self.ids.get(username)
+            if user_id is None:
+                row = self.connection.execute("SELECT user_id FROM user_ids WHERE username = ?",
+                                              (username,)).fetchone()
+                user_id = self.ids[username] = row[0] if row else ""
+        return user_id
+
+    def set(self, username, user_id):
+        username = self._normalize(username)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO user_ids (username, user_id, resolved) VALUES (?, ?, ?)",
+                                    (username, str(user_id), time.time()))
+            self.ids[username] = str(user_id)
+            self.resolved_count += 1
+
+    def preload(self, usernames):
+        # Bulk pass before a run: known ids come in a few indexed queries, the rest is reported as new
+        usernames = list({self._normalize(username) for username in usernames})
+        with self.lock:
+            for offset in range(0, len(usernames), Constants.INSTAGRAM_ID_QUERY_SIZE):
+                chunk = usernames[offset: offset + Constants.INSTAGRAM_ID_QUERY_SIZE]
+                rows = self.connection.execute("SELECT username, user_id FROM user_ids WHERE username IN ({0})".format(
+                    ",".join("?" * len(chunk))), chunk).fetchall()
+                self.ids.update({username: "" for username in chunk})
+                self.ids.update(rows)
+            return [username for username in usernames if not self.ids[username]]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+        self.logger.info("Instagram id store: %d new id(s) resolved", self.resolved_count)
+
+    def _normalize(self, username):
+        return username.strip().lower()
@@ -0,0 +1,67 @@
+import os.path
+import logging
+import threading
+
+from statsbot.constants import Constants
+from statsbot.metrics import Metrics
+from statsbot.rate_limiter import RateLimiter
+
+from instagrapi import Client
+
+
+class InstagramSession:
+
+    def __init__(self, username, password, config, throttle_errors):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.username = username
+        self.password = password
+        self.cred_file = os.path.join(Constants.CREDENTIALS_DIR, Constants.INSTAGRAM_USER_SESSION_FILE.format(username))
+        self.client = Client()
+        # Throttling is applied per account, so every session paces its own requests
+        self.rate_limiter = RateLimiter.from_config(Constants.INSTAGRAM_PLATFORM, config, throttle_errors)
+        self.login_lock = threading.Lock()
+        self.healthy = False
+        self.in_flight = 0
+        self.lookup_count = 0
+        self.error_count = 0
+        self.first_started = None
+        self.last_finished = None
+
+    def login(self, relogin=False):
+        with self.login_lock:
+            try:
+                if not relogin and os.path.exists(self.cred_file):
+                    self.client.load_settings(self.cred_file)
+                self.healthy = self.client.login(self.username, self.password, relogin=relogin)
+                error_message = ""
+            except Exception as e:
+                self.healthy = False
+                error_message = str(e)
+            if self.healthy:
+                self.client.dump_settings(self.cred_file)
+            else:
+                self.logger.error("Failed to login to Instagram as '%s': %s", self.username, error_message)
+        return self.healthy
+
+    def record(self, started, finished, failed):
+        self.lookup_count += 1
+        self.error_count += int(failed)
+        self.first_started = started if self.first_started is None else min(self.first_started, started)
+        self.last_finished = finished if self.last_finished is None else max(self.last_finished, finished)
+        Metrics.get().record("instagram_account", finished - started, error=failed, account=self.username)
+
+    def get_throughput(self):
+        # Lookups per minute over the time this account was in use
+        if not self.lookup_count or self.last_finished <= self.first_started:
+            return 0.0
+        return self.lookup_count * 60 / (self.last_finished - self.first_started)
+
+    def log_stats(self):
+        if self.lookup_count:
+            self.logger.info("Instagram account '%s': %d lookup(s), %d error(s), %.1f lookup(s)/min%s",
+                             self.username, self.lookup_count, self.error_count, self.get_throughput(),
+                             "" if self.healthy else ", rotated out")
+        self.lookup_count = 0
+        self.error_count = 0
+        self.first_started = None
+        self.last_finished = None
@@ -0,0 +1,67 @@
+import os
+import json
+import logging
+import threading
+
+from statsbot.constants import Constants
+
+
+class Journal:
+
+    def __init__(self, file_name, resume=False):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.path = os.path.join(Constants.CACHE_DIR, file_name)
+        self.lock = threading.Lock()
+        self.results = self._load() if resume else {}
+        if not os.path.exists(Constants.CACHE_DIR):
+            os.makedirs(Constants.CACHE_DIR)
+        self.file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        if resume and self.file.tell() and not self._ends_with_newline():
+            self.file.write("\n")
+        self.append_count = 0
+
+    def _load(self):
+        results = {}
+        if not os.path.exists(self.path):
+            self.logger.info("No journal to resume from in %s", self.path)
+            return results
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    results[(record["platform"], record["key"])] = record["result"]
+                except (ValueError, KeyError):
+                    # A record cut short by a crash is simply fetched again
+                    self.logger.warning("Skip damaged journal record: %s", line.strip())
+        self.logger.info("%d result(s) replayed from journal %s", len(results), self.path)
+        return results
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def get_results(self):
+        return dict(self.results)
+
+    def append(self, platform, key, result):
+        line = json.dumps({"platform": platform, "key": key, "result": result}, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+            self.append_count += 1
+
+    def truncate(self):
+        # A finished run has nothing left to resume, a resident process would otherwise grow the file forever
+        with self.lock:
+            self.file.seek(0)
+            self.file.truncate()
+            self.results = {}
+            self.logger.info("%d result(s) appended to journal %s before truncating it", self.append_count, self.path)
+            self.append_count = 0
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+                self.logger.info("%d result(s) appended to journal %s", self.append_count, self.path)
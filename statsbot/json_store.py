@@ -0,0 +1,58 @@
+import os
+import json
+import logging
+import threading
+
+from statsbot.constants import Constants
+
+
+class JsonStore:
+
+    def __init__(self, file_name):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.path = os.path.join(Constants.CACHE_DIR, file_name)
+        self.lock = threading.RLock()
+        self.changed = False
+        self.data = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning("Failed to load %s, starting with an empty store: %s", self.path, str(e))
+            self.data = {}
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.data.get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.changed = True
+
+    def update(self, key, **fields):
+        with self.lock:
+            self.data[key] = {**self.data.get(key, {}), **fields}
+            self.changed = True
+
+    def delete(self, key):
+        with self.lock:
+            if self.data.pop(key, None) is not None:
+                self.changed = True
+
+    def store(self):
+        with self.lock:
+            if not self.changed:
+                return
+            if not os.path.exists(Constants.CACHE_DIR):
+                os.makedirs(Constants.CACHE_DIR)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.changed = False
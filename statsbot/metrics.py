@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+from statsbot.constants import Constants
+
+
+class Series:
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latencies = []
+
+    def observe(self, latency, error, retries, size):
+        self.count += 1
+        self.errors += int(error)
+        self.retries += retries
+        self.bytes += size
+        self.latency_sum += latency
+        # Reservoir sampling keeps percentiles accurate enough while memory stays flat on long runs
+        if len(self.latencies) < Constants.METRICS_RESERVOIR_SIZE:
+            self.latencies.append(latency)
+        else:
+            slot = random.randrange(self.count)
+            if slot < Constants.METRICS_RESERVOIR_SIZE:
+                self.latencies[slot] = latency
+
+    def get_percentile(self, percentile):
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(percentile / 100.0 * len(latencies)))]
+
+
+class Metrics:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.lock = threading.Lock()
+        self.series = {}
+        self.started = time.time()
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+            self.started = time.time()
+
+    def record(self, operation, latency=0.0, error=False, retries=0, size=0, **labels):
+        key = (operation, tuple(sorted(labels.items())))
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series()
+            series.observe(latency, error, retries, size)
+
+    def add_bytes(self, operation, size, **labels):
+        key = (operation, tuple(sorted(labels.items())))
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series()
+            series.bytes += size
+
+    @contextmanager
+    def timer(self, operation, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.record(operation, time.perf_counter() - started, error=True, **labels)
+            raise
+        self.record(operation, time.perf_counter() - started, **labels)
+
+    def get_report(self):
+        with self.lock:
+            series = sorted(self.series.items())
+            report = {"started": self.started,
+                      "finished": time.time(),
+                      "series": []}
+            for (operation, labels), values in series:
+                report["series"].append({"operation": operation,
+                                         "labels": dict(labels),
+                                         "count": values.count,
+                                         "errors": values.errors,
+                                         "retries": values.retries,
+                                         "bytes": values.bytes,
+                                         "latency_sum": values.latency_sum,
+                                         "p50": values.get_percentile(50),
+                                         "p95": values.get_percentile(95),
+                                         "p99": values.get_percentile(99)})
+        report["duration"] = report["finished"] - report["started"]
+        return report
+
+    def write_report(self, metrics_dir=Constants.METRICS_DIR):
+        report = self.get_report()
+        if not os.path.exists(metrics_dir):
+            os.makedirs(metrics_dir)
+        self._write_atomically(os.path.join(metrics_dir, Constants.METRICS_REPORT_FILE),
+                               json.dumps(report, indent=2, ensure_ascii=False))
+        self._write_atomically(os.path.join(metrics_dir, Constants.METRICS_PROMETHEUS_FILE),
+                               self._format_prometheus(report))
+        for series in report["series"]:
+            self.logger.info("Metrics %s %s: count %d, errors %d, retries %d, bytes %d, p50 %.3fs, p95 %.3fs, p99 %.3fs",
+                             series["operation"], str(series["labels"]), series["count"], series["errors"],
+                             series["retries"], series["bytes"], series["p50"], series["p95"], series["p99"])
+        return report
+
+    def _write_atomically(self, path, text):
+        # The textfile collector may read at any moment, so it must never see a half written file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def _format_prometheus(self, report):
+        lines = ["# HELP statsbot_run_duration_seconds Duration of the last StatsBot run",
+                 "# TYPE statsbot_run_duration_seconds gauge",
+                 "statsbot_run_duration_seconds {0}".format(report["duration"]),
+                 "# HELP statsbot_run_finished_timestamp_seconds Time the last StatsBot run finished",
+                 "# TYPE statsbot_run_finished_timestamp_seconds gauge",
+                 "statsbot_run_finished_timestamp_seconds {0}".format(report["finished"]),
+                 "# HELP statsbot_operation_seconds Latency of StatsBot operations",
+                 "# TYPE statsbot_operation_seconds summary"]
+        counters = []
+        for series in report["series"]:
+            labels = dict(series["labels"], operation=series["operation"])
+            for quantile, field in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append("statsbot_operation_seconds{0} {1}".format(self._format_labels(dict(labels, quantile=quantile)),
+                                                                        series[field]))
+            lines.append("statsbot_operation_seconds_sum{0} {1}".format(self._format_labels(labels),
+                                                                        series["latency_sum"]))
+            lines.append("statsbot_operation_seconds_count{0} {1}".format(self._format_labels(labels),
+                                                                          series["count"]))
+            counters.append((labels, series))
+
+        for name, field, description in (("errors", "errors", "Failed StatsBot operations"),
+                                         ("retries", "retries", "Retried StatsBot operations"),
+                                         ("bytes", "bytes", "Bytes received by StatsBot operations")):
+            lines.append("# HELP statsbot_operation_{0}_total {1}".format(name, description))
+            lines.append("# TYPE statsbot_operation_{0}_total counter".format(name))
+            for labels, series in counters:
+                lines.append("statsbot_operation_{0}_total{1} {2}".format(name, self._format_labels(labels),
+                                                                          series[field]))
+        return "\n".join(lines) + "\n"
+
+    def _format_labels(self, labels):
+        return "{" + ",".join('{0}="{1}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                              for name, value in sorted(labels.items())) + "}"
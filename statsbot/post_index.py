@@ -0,0 +1,40 @@
+import datetime
+from bisect import bisect_left
+
+from statsbot.constants import Constants
+from statsbot.json_store import JsonStore
+
+
+class PostIndex:
+
+    def __init__(self, platform):
+        self.store = JsonStore(Constants.POST_INDEX_FILE.format(platform))
+        self.retention_days = max(Constants.POST_WINDOWS)
+
+    def get_oldest_needed(self):
+        return datetime.datetime.now() - datetime.timedelta(days=self.retention_days)
+
+    def get_newest(self, account):
+        timestamps = self.store.get(account, [])
+        return datetime.datetime.fromtimestamp(timestamps[-1]) if timestamps else None
+
+    def add(self, account, post_times, replace=False):
+        timestamps = [] if replace else self.store.get(account, [])
+        newest = timestamps[-1] if timestamps else None
+        timestamps = timestamps + sorted(timestamp for timestamp in (int(post_time.timestamp()) for post_time in post_times)
+                                         if newest is None or timestamp > newest)
+
+        # Only the largest window is ever counted, but the newest post is kept for the last post date
+        start = bisect_left(timestamps, int(self.get_oldest_needed().timestamp()))
+        self.store.set(account, timestamps[min(start, len(timestamps) - 1):])
+
+    def count_since(self, account, days):
+        timestamps = self.store.get(account, [])
+        since = datetime.datetime.now() - datetime.timedelta(days=days)
+        return len(timestamps) - bisect_left(timestamps, int(since.timestamp()))
+
+    def get_window_counts(self, account, column_format):
+        return {column_format.format(days): self.count_since(account, days) for days in Constants.POST_WINDOWS}
+
+    def flush(self):
+        self.store.store()
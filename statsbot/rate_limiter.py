@@ -0,0 +1,138 @@
+import time
+import asyncio
+import logging
+import threading
+
+from statsbot.constants import Constants
+from statsbot.metrics import Metrics
+
+
+class RateLimiter:
+    THROTTLE_STATUS_CODE = 429
+    CONCURRENCY_POLL_INTERVAL = 0.05
+    SUCCESSES_TO_RAMP_UP = 10
+    RAMP_UP_FACTOR = 1.25
+    MIN_RATE_FRACTION = 0.05
+
+    def __init__(self, platform, rate, burst, max_concurrency, throttle_errors=()):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.platform = platform
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.last_refill = time.monotonic()
+        self.max_concurrency = max(max_concurrency, 1)
+        self.concurrency = self.max_concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.request_count = 0
+        self.throttle_count = 0
+        self.throttle_errors = tuple(throttle_errors)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @classmethod
+    def from_config(cls, platform, config, throttle_errors=()):
+        rate = float(config.get(Constants.CONFIG_RATE.format(platform), 0))
+        burst = int(config.get(Constants.CONFIG_BURST.format(platform), 1))
+        concurrency = int(config.get(Constants.CONFIG_CONCURRENCY.format(platform),
+                                     Constants.DEFAULT_CONCURRENCY.get(platform, 1)))
+        return cls(platform, rate, burst, concurrency, throttle_errors)
+
+    def __enter__(self):
+        if not hasattr(self.local, "started"):
+            self.local.started = []
+        self.local.started.append(self.acquire())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release(throttled=exc_value is not None and self.is_throttle_error(exc_value),
+                     started=self.local.started.pop(),
+                     error=exc_value is not None)
+        return False
+
+    def acquire(self):
+        wait = self._try_acquire()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self._try_acquire()
+        return time.perf_counter()
+
+    async def acquire_async(self):
+        wait = self._try_acquire()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self._try_acquire()
+        return time.perf_counter()
+
+    def release(self, throttled=False, started=None, error=False):
+        # Every outbound call passes through the limiter, which makes it the place to time them
+        if started is not None:
+            Metrics.get().record("request", time.perf_counter() - started, error=error or throttled,
+                                 platform=self.platform)
+        with self.lock:
+            self.in_flight -= 1
+            if throttled:
+                self._back_off()
+            else:
+                self._ramp_up()
+
+    def report_throttle(self):
+        with self.lock:
+            self._back_off()
+
+    def is_throttle_error(self, error):
+        if isinstance(error, self.throttle_errors):
+            return True
+        response = getattr(error, "response", None)
+        return self.THROTTLE_STATUS_CODE in (getattr(error, "code", None),
+                                             getattr(error, "status", None),
+                                             getattr(response, "status_code", None))
+
+    def get_rates(self):
+        with self.lock:
+            return {"platform": self.platform,
+                    "rate": self.rate,
+                    "max_rate": self.max_rate,
+                    "concurrency": self.concurrency,
+                    "max_concurrency": self.max_concurrency,
+                    "in_flight": self.in_flight,
+                    "requests": self.request_count,
+                    "throttled": self.throttle_count}
+
+    def _try_acquire(self):
+        with self.lock:
+            if self.in_flight >= self.concurrency:
+                return self.CONCURRENCY_POLL_INTERVAL
+
+            if self.rate > 0:
+                now = time.monotonic()
+                self.tokens = min(float(self.burst), self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens < 1:
+                    return (1 - self.tokens) / self.rate
+                self.tokens -= 1
+
+            self.in_flight += 1
+            self.request_count += 1
+            return 0
+
+    def _back_off(self):
+        self.successes = 0
+        self.throttle_count += 1
+        self.concurrency = max(1, self.concurrency // 2)
+        if self.rate > 0:
+            self.rate = max(self.max_rate * self.MIN_RATE_FRACTION, self.rate / 2)
+            self.tokens = 0
+        self.logger.warning("Throttled by %s: backing off to %.3f request(s)/sec, concurrency %d",
+                            self.platform, self.rate, self.concurrency)
+
+    def _ramp_up(self):
+        self.successes += 1
+        if self.successes < self.SUCCESSES_TO_RAMP_UP:
+            return
+        self.successes = 0
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+        if self.rate > 0:
+            self.rate = min(self.max_rate, self.rate * self.RAMP_UP_FACTOR)
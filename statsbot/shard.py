@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import socket
+import logging
+import sqlite3
+import threading
+
+from statsbot.constants import Constants
+
+
+class Shard:
+
+    def __init__(self, index, count, database, run_id, lease_ttl=Constants.SHARD_LEASE_TTL):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        if count < 1 or not 0 <= index < count:
+            raise ValueError("Invalid shard {0}/{1}".format(index, count))
+        self.index = index
+        self.count = count
+        # Workers and the coordinator of one run share a run id, rows of any other run are never read
+        self.run_id = run_id
+        self.lease_ttl = lease_ttl
+        self.owner = "{0}:{1}:{2}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.lock = threading.Lock()
+        self.acquired_count = 0
+        self.skipped_count = 0
+        self.stored_count = 0
+
+        database_dir = os.path.dirname(database)
+        if database_dir and not os.path.exists(database_dir):
+            os.makedirs(database_dir)
+        self.connection = sqlite3.connect(database, timeout=Constants.SHARD_DATABASE_TIMEOUT,
+                                          isolation_level=None, check_same_thread=False)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(leases)")]
+        if columns and "run" not in columns:
+            # Leases written before runs were scoped can't be told apart from the current run's
+            self.connection.execute("DROP TABLE leases")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS leases ("
+                                "run TEXT NOT NULL, "
+                                "platform TEXT NOT NULL, "
+                                "key TEXT NOT NULL, "
+                                "owner TEXT NOT NULL, "
+                                "expires REAL NOT NULL, "
+                                "result TEXT, "
+                                "PRIMARY KEY (run, platform, key))")
+
+    @classmethod
+    def from_argument(cls, argument, database, run_id):
+        index, _, count = argument.partition("/")
+        return cls(int(index), int(count), database, run_id)
+
+    def owns(self, platform, key):
+        # crc32 is stable across processes and hosts, unlike the salted built-in hash
+        return zlib.crc32("{0}:{1}".format(platform, key).encode("utf-8")) % self.count == self.index
+
+    def acquire(self, platform, key):
+        # A key is taken unless another live worker holds its lease or it is already done
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute("SELECT owner, expires, result FROM leases "
+                                              "WHERE run = ? AND platform = ? AND key = ?",
+                                              (self.run_id, platform, key)).fetchone()
+                acquired = row is None or (row[2] is None and (row[0] == self.owner or row[1] < now))
+                if acquired:
+                    self.connection.execute("INSERT OR REPLACE INTO leases (run, platform, key, owner, expires, result) "
+                                            "VALUES (?, ?, ?, ?, ?, NULL)",
+                                            (self.run_id, platform, key, self.owner, now + self.lease_ttl))
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            if acquired:
+                self.acquired_count += 1
+            else:
+                self.skipped_count += 1
+        return acquired
+
+    def append(self, platform, key, result):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO leases (run, platform, key, owner, expires, result) "
+                                    "VALUES (?, ?, ?, ?, ?, ?)",
+                                    (self.run_id, platform, key, self.owner, time.time(),
+                                     json.dumps(result, ensure_ascii=False)))
+            self.stored_count += 1
+
+    def release(self, platform, key):
+        # A failed lookup gives its lease up at once, so the merge step fetches it again.
+        # Leases held by other workers are left alone
+        with self.lock:
+            self.connection.execute("DELETE FROM leases WHERE run = ? AND platform = ? AND key = ? "
+                                    "AND owner = ? AND result IS NULL",
+                                    (self.run_id, platform, key, self.owner))
+
+    def get_results(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT platform, key, result FROM leases "
+                                           "WHERE run = ? AND result IS NOT NULL", (self.run_id,)).fetchall()
+        return {(platform, key): json.loads(result) for platform, key, result in rows}
+
+    def clear(self):
+        # Called once the merged results are written back, abandoned runs go once they are old enough
+        with self.lock:
+            deleted = self.connection.execute("DELETE FROM leases WHERE run = ? OR expires < ?",
+                                              (self.run_id, time.time() - Constants.SHARD_RUN_TTL)).rowcount
+        self.logger.info("%d lease(s) of run %s and stale runs cleared", deleted, self.run_id)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+        self.logger.info("Shard %d/%d: %d lease(s) acquired, %d held by other workers, %d result(s) stored",
+                         self.index, self.count, self.acquired_count, self.skipped_count, self.stored_count)
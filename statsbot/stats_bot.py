@@ -1,73 +1,301 @@
 from datetime import datetime
+import time
+import asyncio
 import logging
+import importlib
 import concurrent.futures
 
 from statsbot.constants import Constants
-from statsbot.who_is_extractor import WhoIsExtractor
-from statsbot.instagram_extractor import InstagramExtractor
-from statsbot.youtube_extractor import YoutubeExtractor
-from statsbot.facebook_extractor import FacebookExtractor
+from statsbot.metrics import Metrics
 
 
 class StatsBot:
+    # Page column, module and class of every extractor, imported and constructed only once a run maps its column
+    EXTRACTORS = [(Constants.SITE_TAG, "statsbot.who_is_extractor", "WhoIsExtractor"),
+                  (Constants.INSTAGRAM_PAGE, "statsbot.instagram_extractor", "InstagramExtractor"),
+                  (Constants.YOUTUBE_PAGE, "statsbot.youtube_extractor", "YoutubeExtractor"),
+                  (Constants.FACEBOOK_PAGE, "statsbot.facebook_extractor", "FacebookExtractor")]
 
-    def __init__(self, config):
+    def __init__(self, config, extractors=None, journal=None, shard=None, freshness=None):
         self.logger = logging.getLogger(Constants.LOGGER_NAME)
         self.config = config
         self.updated_users = []
+        self.pending_jobs = []
+        self.merge_count = 0
+        self.journal = journal
+        self.shard = shard
+        self.freshness = freshness
+        self.lookup_results = journal.get_results() if journal else {}
+        if shard:
+            self.lookup_results.update(shard.get_results())
+        self.on_row = None
         self.last_run_timestamp = None
-        self.logger.info("Statistics will have been collected in %s mode",
-                         "parallel" if int(self.config[Constants.CONFIG_THREADPOOL_SIZE]) else "one-thread")
-        self.extractors = [WhoIsExtractor(),
-                           InstagramExtractor(self.config),
-                           YoutubeExtractor(self.config),
-                           FacebookExtractor(self.config)]
-
-    def run(self, users):
+        self.run_mode = self._get_run_mode()
+        self.logger.info("Statistics will have been collected in %s mode", self.run_mode)
+        self.lazy_extractors = extractors is None
+        self.loaded_extractors = {}
+        self.extractors = extractors if extractors is not None else []
+
+    def _get_run_mode(self):
+        run_in_parallel = str(self.config.get(Constants.CONFIG_RUN_IN_PARALLEL, "0")).strip().lower()
+        if run_in_parallel == Constants.RUN_MODE_ASYNC:
+            return Constants.RUN_MODE_ASYNC
+        return Constants.RUN_MODE_PARALLEL if int(run_in_parallel) else Constants.RUN_MODE_SEQUENTIAL
+
+    def _get_concurrency(self, extractor):
+        # Concurrency is configured per account, extractors with several sessions run that many times more
+        return int(self.config.get(Constants.CONFIG_CONCURRENCY.format(extractor.PLATFORM),
+                                   Constants.DEFAULT_CONCURRENCY.get(extractor.PLATFORM, 1))) * \
+            max(extractor.get_session_count(), 1)
+
+    def run(self, users, on_row=None):
         updated_users = []
         if not isinstance(users, list) or not users:
             self.logger.warning("Skip collecting stats request: no incoming data")
             return updated_users
 
-        if int(self.config[Constants.CONFIG_RUN_IN_PARALLEL]):
-            updated_users = self._run_in_parallel(users)
+        # Rows are handed to on_row as soon as every lookup they depend on has finished
+        self.on_row = on_row
+        self.updated_users = [dict(user) for user in users]
+        self.pending_jobs = [0] * len(users)
+        self.merge_count = 0
+        if self.lazy_extractors:
+            self._load_extractors(users)
+        jobs = self._plan(users)
+        for index, pending in enumerate(self.pending_jobs):
+            if not pending:
+                self._emit_row(index)
+
+        if self.run_mode == Constants.RUN_MODE_ASYNC:
+            self._run_async(users, jobs)
+        elif self.run_mode == Constants.RUN_MODE_PARALLEL:
+            self._run_in_parallel(users, jobs)
         else:
-            updated_users = self._run(users)
+            self._run(users, jobs)
+        updated_users = self.updated_users
 
         self.last_run_timestamp = datetime.now()
-        self.logger.info("Finished collecting stats at %s", self.last_run_timestamp)
+        self.logger.info("Finished collecting stats at %s, %d row update(s) merged",
+                         self.last_run_timestamp, self.merge_count)
+        self.logger.info("Rate limits: %s", str(self.get_rate_limits()))
         return updated_users, self.last_run_timestamp
 
-    def _run_in_parallel(self, users):
-        updated_users = []
-        futures = []
-        with concurrent.futures.ThreadPoolExecutor(int(self.config[Constants.CONFIG_THREADPOOL_SIZE])) as pool:
-            user_futures = []
-            for user in users:
-                for extractor in self.extractors:
-                    if extractor.is_working():
-                        user_futures.append(pool.submit(extractor.get_stats, user=user))
-                futures.append(user_futures)
-
-            for index, user_futures in enumerate(futures):
-                user = users[index]
-                for future in concurrent.futures.as_completed(user_futures):
-                    user = {**user, **future.result()}
-                updated_users.append(user)
-        return updated_users
-
-    def _run(self, users):
-        updated_users = []
+    def _load_extractors(self, users):
+        columns = set()
         for user in users:
-            for extractor in self.extractors:
-                if extractor.is_working():
-                    user = {**user, **extractor.get_stats(user)}
-            updated_users.append(user)
-        return updated_users
+            columns.update(user)
+        for column, module_name, class_name in self.EXTRACTORS:
+            if column not in columns or column in self.loaded_extractors:
+                continue
+            started = time.perf_counter()
+            extractor_class = getattr(importlib.import_module(module_name), class_name)
+            self.loaded_extractors[column] = extractor_class(self.config)
+            self.logger.info("%s loaded in %.2fs", class_name, time.perf_counter() - started)
+        # Keep the registry order, so platforms are planned the same way whatever order their columns showed up in
+        self.extractors = [self.loaded_extractors[column] for column, _, _ in self.EXTRACTORS
+                           if column in self.loaded_extractors]
+
+    def get_rate_limits(self):
+        return [rates for extractor in self.extractors for rates in extractor.get_rate_limits()]
+
+    def _plan(self, users):
+        # Rows sharing a normalized key are looked up once per platform, results are copied back to every row.
+        # Keys resolved by earlier runs are answered from memory, so sheets processed in groups still share lookups
+        jobs = []
+        row_count = 0
+        lookup_count = 0
+        for extractor in self.extractors:
+            if not extractor.is_working():
+                continue
+            key_rows = {}
+            for index, user in enumerate(users):
+                key = extractor.get_key(user)
+                if key is None:
+                    key = index
+                elif not key:
+                    continue
+                key_rows.setdefault(key, []).append(index)
+
+            if self.shard:
+                # Other shards look up the remaining keys, their rows are left untouched here
+                key_rows = {key: indexes for key, indexes in key_rows.items()
+                            if self.shard.owns(extractor.PLATFORM, key)}
+
+            lookups = []
+            fresh_count = 0
+            for key, indexes in key_rows.items():
+                known_stats = self.lookup_results.get((extractor.PLATFORM, key)) if isinstance(key, str) else None
+                if known_stats is not None:
+                    self._merge_stats(indexes, known_stats)
+                elif self.freshness and isinstance(key, str) and \
+                        self.freshness.is_fresh(extractor.PLATFORM, key, [users[index] for index in indexes],
+                                                extractor.FIELDS):
+                    # Cells fetched within their freshness policy keep the values already in the sheet
+                    fresh_count += 1
+                else:
+                    lookups.append((key, indexes))
+            if lookups:
+                extractor.prepare([key for key, _ in lookups if isinstance(key, str)])
+            rows = sum(len(indexes) for indexes in key_rows.values())
+            self.logger.info("%s: %d row(s) need %d unique lookup(s), %d known from previous runs, %d still fresh",
+                             extractor.PLATFORM, rows, len(lookups), len(key_rows) - len(lookups) - fresh_count,
+                             fresh_count)
+            row_count += rows
+            lookup_count += len(lookups)
+
+            job_size = extractor.BATCH_SIZE or 1
+            for offset in range(0, len(lookups), job_size):
+                job = (extractor, lookups[offset: offset + job_size])
+                for _, indexes in job[1]:
+                    for index in indexes:
+                        self.pending_jobs[index] += 1
+                jobs.append(job)
+
+        if lookup_count:
+            self.logger.info("Deduplication ratio %.2f: %d row lookup(s) planned as %d request(s)",
+                             row_count / lookup_count, row_count, lookup_count)
+        return jobs
+
+    def _claim_job_users(self, job, users):
+        # Lookups leased by another worker get None instead of a user and come back as empty stats
+        extractor, lookups = job
+        return [users[indexes[0]] if not self.shard or not isinstance(key, str) or
+                self.shard.acquire(extractor.PLATFORM, key) else None
+                for key, indexes in lookups]
+
+    def _align_job_stats(self, job_users, claimed_stats):
+        claimed_stats = iter(claimed_stats)
+        return [next(claimed_stats) if user is not None else {} for user in job_users]
+
+    def _complete_job(self, job, job_stats):
+        extractor, lookups = job
+        for (key, indexes), stats in zip(lookups, job_stats):
+            if isinstance(key, str):
+                self.lookup_results[(extractor.PLATFORM, key)] = stats
+                # Empty stats mean the lookup failed, leave it to be fetched again on resume
+                if self.journal and stats:
+                    self.journal.append(extractor.PLATFORM, key, stats)
+                if self.shard and stats:
+                    self.shard.append(extractor.PLATFORM, key, stats)
+                elif self.shard:
+                    self.shard.release(extractor.PLATFORM, key)
+                if self.freshness:
+                    self.freshness.touch(extractor.PLATFORM, key, list(stats))
+            self._merge_stats(indexes, stats)
+            for index in indexes:
+                self.pending_jobs[index] -= 1
+                if not self.pending_jobs[index]:
+                    self._emit_row(index)
 
-    def stop(self):
+    def _merge_stats(self, indexes, stats):
+        for index in indexes:
+            self.updated_users[index].update(stats)
+        self.merge_count += len(indexes)
+
+    def _emit_row(self, index):
+        if self.on_row:
+            self.on_row(index, self.updated_users[index])
+
+    def clear_lookup_results(self):
+        self.lookup_results = {}
+
+    def _execute(self, job, users):
+        extractor = job[0]
+        job_users = self._claim_job_users(job, users)
+        claimed_users = [user for user in job_users if user is not None]
+        started = time.perf_counter()
+        if not claimed_users:
+            claimed_stats = []
+        elif extractor.BATCH_SIZE:
+            claimed_stats = extractor.get_stats_batch(claimed_users)
+        else:
+            claimed_stats = [extractor.get_stats(claimed_users[0])]
+        self._record_extraction(extractor, started, claimed_stats)
+        return self._align_job_stats(job_users, claimed_stats)
+
+    def _record_extraction(self, extractor, started, claimed_stats):
+        if claimed_stats:
+            # Extractors log and swallow their failures, an empty result is how a failed lookup shows up
+            Metrics.get().record("extract", time.perf_counter() - started, error=not all(claimed_stats),
+                                 platform=extractor.PLATFORM)
+
+    def _run_in_parallel(self, users, jobs):
+        # Every platform gets its own pool, so a throttled platform only holds its own workers
+        threadpool_size = int(self.config[Constants.CONFIG_THREADPOOL_SIZE])
+        pools = {extractor: concurrent.futures.ThreadPoolExecutor(min(threadpool_size,
+                                                                      self._get_concurrency(extractor)))
+                 for extractor in {extractor for extractor, _ in jobs}}
+        try:
+            # One stream over every job: results are routed by row index into preallocated rows as they finish
+            futures = {pools[job[0]].submit(self._execute, job, users): job for job in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                self._complete_job(futures[future], future.result())
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+
+    def _run_async(self, users, jobs):
+        return asyncio.run(self._collect_async(users, jobs))
+
+    async def _collect_async(self, users, jobs):
+        extractors = [extractor for extractor in self.extractors if extractor.is_working()]
+        limits = {extractor: self._get_concurrency(extractor) for extractor in extractors}
+        semaphores = {extractor: asyncio.Semaphore(limit) for extractor, limit in limits.items()}
+
+        # Only blocking extractors need threads, and never more than their concurrency limits allow
+        blocking_threads = sum(limit for extractor, limit in limits.items() if not extractor.NATIVE_ASYNC)
+        asyncio.get_running_loop().set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(max(blocking_threads, 1)))
+        self.logger.debug("Async concurrency limits: %s",
+                          str({extractor.PLATFORM: limit for extractor, limit in limits.items()}))
+
+        for extractor in extractors:
+            await extractor.on_start_async()
+        try:
+            await asyncio.gather(*[self._execute_async(job, users, semaphores[job[0]]) for job in jobs])
+        finally:
+            for extractor in extractors:
+                await extractor.on_stop_async()
+
+    async def _execute_async(self, job, users, semaphore):
+        extractor = job[0]
+        async with semaphore:
+            job_users = self._claim_job_users(job, users)
+            claimed_users = [user for user in job_users if user is not None]
+            started = time.perf_counter()
+            if not claimed_users:
+                claimed_stats = []
+            elif extractor.BATCH_SIZE:
+                claimed_stats = await extractor.get_stats_batch_async(claimed_users)
+            else:
+                claimed_stats = [await extractor.get_stats_async(claimed_users[0])]
+            self._record_extraction(extractor, started, claimed_stats)
+        self._complete_job(job, self._align_job_stats(job_users, claimed_stats))
+
+    def _run(self, users, jobs):
+        for job in jobs:
+            self._complete_job(job, self._execute(job, users))
+
+    def flush(self, failed=False):
+        for extractor in self.extractors:
+            extractor.flush()
+        self._flush_freshness(failed)
+
+    def stop(self, failed=False):
         for extractor in self.extractors:
             extractor.on_stop()
+        self._flush_freshness(failed)
+        if self.journal:
+            self.journal.close()
+        if self.shard:
+            self.shard.close()
+
+    def _flush_freshness(self, failed):
+        # Lookups are only recorded as fresh once their values made it to the sheet
+        if self.freshness:
+            if failed:
+                self.freshness.discard()
+            self.freshness.flush()
 
     def get_stats(self):
         self.logger.info("Returning stats collected at %s", self.last_run_timestamp)
@@ -0,0 +1,216 @@
+import json
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+from statsbot.constants import Constants
+
+
+class StatsJob:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, users):
+        self.id = uuid.uuid4().hex
+        self.users = users
+        self.status = self.QUEUED
+        self.rows = [None] * len(users)
+        self.finished = []
+        self.error = ""
+
+    def get_state(self, since):
+        return {"job_id": self.id,
+                "status": self.status,
+                "total": len(self.rows),
+                "finished": len(self.finished),
+                "error": self.error,
+                "rows": [{"index": index, "row": self.rows[index]} for index in self.finished[since:]]}
+
+
+class StatsServer:
+
+    def __init__(self, stats_bot, host, port):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.stats_bot = stats_bot
+        self.jobs = OrderedDict()
+        self.latest_job = None
+        self.changed = threading.Condition()
+        self.job_queue = queue.Queue()
+        self.worker = threading.Thread(target=self._work, daemon=True)
+        self.http_server = ThreadingHTTPServer((host, port), StatsRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.stats_server = self
+
+    def serve_forever(self):
+        self.worker.start()
+        self.logger.info("Serving %s on %s:%d", Constants.SERVER_STATS_PATH, *self.http_server.server_address[:2])
+        try:
+            self.http_server.serve_forever()
+        finally:
+            self.http_server.server_close()
+
+    def shutdown(self):
+        self.http_server.shutdown()
+        self.job_queue.put(None)
+
+    def close(self):
+        # Queued jobs are dropped, the running one finishes before StatsBot closes the stores it writes to
+        while True:
+            try:
+                job = self.job_queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                with self.changed:
+                    job.status = job.FAILED
+                    job.error = "Server stopped"
+                    self.changed.notify_all()
+        self.job_queue.put(None)
+        if self.worker.is_alive():
+            self.worker.join()
+
+    def submit(self, users):
+        job = StatsJob(users)
+        with self.changed:
+            self.jobs[job.id] = job
+            while len(self.jobs) > Constants.SERVER_MAX_JOBS:
+                self.jobs.popitem(last=False)
+        self.job_queue.put(job)
+        self.logger.info("Job %s queued with %d row(s)", job.id, len(users))
+        return job
+
+    def get_job(self, job_id):
+        with self.changed:
+            return self.jobs.get(job_id)
+
+    def get_latest(self, etag, wait):
+        # Long poll: answer as soon as a newer job finished or the wait is over, whichever comes first
+        with self.changed:
+            self.changed.wait_for(lambda: self._get_latest_etag() != etag, timeout=wait)
+            rows = self.latest_job.rows if self.latest_job else []
+            return rows, self._get_latest_etag()
+
+    def get_job_state(self, job, since, wait):
+        with self.changed:
+            self.changed.wait_for(lambda: len(job.finished) > since or job.status in (job.DONE, job.FAILED),
+                                  timeout=wait)
+            return job.get_state(since)
+
+    def _get_latest_etag(self):
+        return '"{0}"'.format(self.latest_job.id if self.latest_job else "none")
+
+    def _work(self):
+        # StatsBot runs one job at a time in the background, request threads only read finished rows
+        while True:
+            job = self.job_queue.get()
+            if job is None:
+                return
+            with self.changed:
+                job.status = job.RUNNING
+                self.changed.notify_all()
+            try:
+                self.stats_bot.run(job.users, lambda index, row: self._finish_row(job, index, row))
+                status = job.DONE
+            except Exception as e:
+                self.logger.error("Job %s failed: %s", job.id, str(e))
+                job.error = str(e)
+                status = job.FAILED
+            with self.changed:
+                job.status = status
+                if status == job.DONE:
+                    self.latest_job = job
+                self.changed.notify_all()
+            self.logger.info("Job %s finished: %s, %d of %d row(s)", job.id, status, len(job.finished), len(job.rows))
+            # Results of this job must not answer the next one, caches and sessions stay
+            self.stats_bot.clear_lookup_results()
+            self.stats_bot.flush(failed=status == job.FAILED)
+
+    def _finish_row(self, job, index, row):
+        with self.changed:
+            job.rows[index] = row
+            job.finished.append(index)
+            self.changed.notify_all()
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        path, _ = self._parse_path()
+        if path != Constants.SERVER_STATS_PATH:
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            users = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+        except ValueError as e:
+            self._send_json(400, {"error": "Invalid JSON: " + str(e)})
+            return
+        if not isinstance(users, list) or not users or not all(isinstance(user, dict) for user in users):
+            self._send_json(400, {"error": "Expected a non-empty JSON array of row objects"})
+            return
+
+        job = self.server.stats_server.submit(users)
+        self._send_json(200, {"job_id": job.id, "status": job.status})
+
+    def do_GET(self):
+        path, query = self._parse_path()
+        if path != Constants.SERVER_STATS_PATH:
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            wait = min(float(query.get("wait", ["0"])[0]), Constants.SERVER_MAX_WAIT)
+            since = int(query.get("since", ["-1"])[0])
+        except ValueError:
+            self._send_json(400, {"error": "wait and since must be numbers"})
+            return
+        stats_server = self.server.stats_server
+
+        job_id = query.get("job", [""])[0]
+        if not job_id:
+            etag = self.headers.get("If-None-Match", "")
+            rows, latest_etag = stats_server.get_latest(etag, wait)
+            if etag == latest_etag:
+                self._send_json(304, None, {"ETag": latest_etag})
+            else:
+                self._send_json(200, rows, {"ETag": latest_etag})
+            return
+
+        job = stats_server.get_job(job_id)
+        if job is None:
+            self._send_json(404, {"error": "Unknown job " + job_id})
+        elif since >= 0:
+            # Incremental results: rows finished after the first `since` ones, in completion order
+            self._send_json(200, stats_server.get_job_state(job, since, wait))
+        else:
+            # Status and error on every answer so Statistics.gs can stop on a failed job, all rows once it is done
+            state = stats_server.get_job_state(job, len(job.rows), wait)
+            self._send_json(200, {"job_id": job.id,
+                                  "status": state["status"],
+                                  "error": state["error"],
+                                  "rows": job.rows if state["status"] == job.DONE else []})
+
+    def _parse_path(self):
+        # Statistics.gs joins APP_HOST and the endpoint with an extra slash, so "//stats" must work too
+        path, _, query = self.path.partition("?")
+        return "/" + path.strip("/"), parse_qs(query)
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8") if data is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger(Constants.LOGGER_NAME).debug("%s - %s", self.address_string(), format % args)
@@ -1,26 +1,33 @@
-import re
-import requests
+import time
+import asyncio
 import logging
-from random import shuffle
+import concurrent.futures
+
+import aiohttp
+import requests
 
 from statsbot.constants import Constants
 from statsbot.extractor import Extractor
+from statsbot.http_client import HttpClient
+from statsbot.rate_limiter import RateLimiter
+from statsbot.whois_cache import WhoIsCache
+from statsbot.whois_client import WhoIsClient
+from statsbot.whois_provider import WhoIsProvider
 
 
 class WhoIsExtractor(Extractor):
-    UNKNOWN_YEAR = -1
-
-    CREATION_DATE_SEARCH_TAG = "reat"
-    CREATION_DATE_STRING_MAGIC_LENGTH = 50
-
-    YEAR_REGEXP = re.compile(r"^.*(\d{4})[-,.]\d{2}[-,.]\d{2}.*$", re.MULTILINE)
+    PLATFORM = Constants.WHOIS_PLATFORM
+    NATIVE_ASYNC = True
+    FIELDS = [Constants.SITE_YEAR_TAG]
 
     CONFIG = [{
         "whois": "https://www.whois.com/whois/",
-        "tags": ["registryData", "registrarData"]
+        "tags": ["registryData", "registrarData"],
+        "end": "</pre>"
     }, {
         "whois": "https://www.whois.ru/",
-        "tags": ["raw-domain-info-pre"]
+        "tags": ["raw-domain-info-pre"],
+        "end": "</pre>"
     }, {
         "whois": "https://www.nic.ru/whois/?searchWord=",
         "tags": ["Whois-card"]
@@ -33,64 +40,236 @@ class WhoIsExtractor(Extractor):
         "User-Agent": "Mozilla/5.0 (Macintosh Intel Mac OS X 10_13_6) AppleWebKit/605.1.15 (Kresponse.text, like Gecko) "
                       "Version/11.1.2 Safari/605.1.15"}
 
-    def __init__(self):
+    def __init__(self, config):
         self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.config = config
+        self.rate_limiter = RateLimiter.from_config(self.PLATFORM, self.config)
+        self.http_client = HttpClient.get(self.config)
+        self.cache = WhoIsCache(self.config)
+        self.providers = [WhoIsProvider(config["whois"], config["tags"], self.HEADERS, config.get("end"))
+                          for config in self.CONFIG]
+        # Native mode asks registries over port 43 or RDAP first, the HTML pages are only a fallback
+        self.client = None
+        if self.config.get(Constants.CONFIG_WHOIS_MODE, Constants.WHOIS_MODE_HTML) == Constants.WHOIS_MODE_NATIVE:
+            self.client = WhoIsClient(self.http_client)
+            self.logger.info("WhoIs creation dates are queried over port 43 and RDAP, HTML providers are a fallback")
+
+        self.hedge_delay = float(self.config.get(Constants.CONFIG_WHOIS_HEDGE_DELAY, 0))
+        self.hedge_pool = None
+        if self.hedge_delay > 0:
+            self.hedge_pool = concurrent.futures.ThreadPoolExecutor(
+                self.rate_limiter.max_concurrency * len(self.providers))
+            self.logger.info("WhoIs providers are hedged after %.1f second(s)", self.hedge_delay)
+
+    async def on_start_async(self):
+        await self.http_client.start_async()
+
+    async def on_stop_async(self):
+        await self.http_client.stop_async()
+
+    def on_stop(self):
+        if self.hedge_pool:
+            self.hedge_pool.shutdown()
+        self.flush()
+
+    def flush(self):
+        self.logger.info("WhoIs providers: %s", str([provider.get_stats() for provider in self.providers]))
+        self.cache.flush()
+
+    def get_key(self, user):
+        if not user.get(Constants.SITE_TAG):
+            return ""
+        if user.get(Constants.SITE_YEAR_TAG) and int(user[Constants.SITE_YEAR_TAG]) != Constants.UNKNOWN_YEAR:
+            return ""
+        return self._extract_domain(user[Constants.SITE_TAG]).lower()
 
     def get_stats(self, user):
+        # _collect_stats yields domains and expects their creation years back
+        flow = self._collect_stats(user)
+        try:
+            domain = next(flow)
+            while True:
+                year = self.cache.get_year(domain)
+                if year is None:
+                    year = self.get_creation_year(domain)
+                    self._cache_year(domain, year)
+                domain = flow.send(year)
+        except StopIteration as stop:
+            return stop.value
+
+    async def get_stats_async(self, user):
+        flow = self._collect_stats(user)
+        try:
+            domain = next(flow)
+            while True:
+                year = self.cache.get_year(domain)
+                if year is None:
+                    year = await self.get_creation_year_async(domain)
+                    self._cache_year(domain, year)
+                domain = flow.send(year)
+        except StopIteration as stop:
+            return stop.value
+
+    def _collect_stats(self, user):
         updated_user = {}
         if not user.get(Constants.SITE_TAG):
             return updated_user
-        if user.get(Constants.SITE_YEAR_TAG) and int(user[Constants.SITE_YEAR_TAG]) != WhoIsExtractor.UNKNOWN_YEAR:
+        if user.get(Constants.SITE_YEAR_TAG) and int(user[Constants.SITE_YEAR_TAG]) != Constants.UNKNOWN_YEAR:
             self.logger.debug("Domain creation year for url `%s` is already known: %s",
                               user.get(Constants.SITE_TAG), user.get(Constants.SITE_YEAR_TAG))
             return updated_user
         domain = self._extract_domain(user[Constants.SITE_TAG])
-        year = self.get_creation_year(domain)
-        if year == WhoIsExtractor.UNKNOWN_YEAR:
+        parent_domain = self.cache.get_parent(domain)
+        if parent_domain:
+            self.logger.debug("Subdomain %s is known to resolve through domain %s", domain, parent_domain)
+            domain = parent_domain
+        year = yield domain
+        if not self._is_valid_year(year):
             subdomain_pos = domain.find(".")
             if subdomain_pos > 0 and domain.find(".", subdomain_pos + 1) > 0:
+                subdomain = domain
                 domain = domain[subdomain_pos + 1:]
                 self.logger.debug("Subdomain creation year unknown. Going to resolve year for domain %s", domain)
-                year = self.get_creation_year(domain)
-        updated_user[Constants.SITE_YEAR_TAG] = year
+                year = yield domain
+                if self._is_valid_year(year):
+                    self.cache.set_parent(subdomain, domain)
+        # Unanswered lookups leave the cell unknown too, so the next run asks again
+        updated_user[Constants.SITE_YEAR_TAG] = Constants.UNKNOWN_YEAR if year is None else year
         return updated_user
 
+    def _cache_year(self, domain, year):
+        # None means no source answered at all, which says nothing about the domain and is never cached
+        if year is not None:
+            self.cache.set_year(domain, year)
+
     def get_creation_year(self, domain):
-        shuffle(self.CONFIG)
-
-        for config in self.CONFIG:
-            self.logger.debug("Requesting %s for domain %s", config["whois"], domain)
-
-            response = requests.get(config["whois"] + domain, headers=self.HEADERS)
-            if response.status_code != 200:
-                self.logger.debug("Got %d HTTP status code from %s for %s", response.status_code, config["whois"], domain)
-                continue
-
-            raw_data_position = 0
-            for search_tag in config["tags"]:
-                raw_data_position = response.text.find(search_tag)
-                if raw_data_position > 0:
-                    break
-
-            if raw_data_position <= 0:
-                self.logger.debug("Maybe captcha. Cannot find any search tag in %s for %s", config["whois"], domain)
-                continue
-
-            search_tag_position = response.text.find(self.CREATION_DATE_SEARCH_TAG, raw_data_position)
-            while search_tag_position > -1:
-                if response.text[search_tag_position - 1] == "c" or response.text[search_tag_position - 1] == "C":
-                    test_string = response.text[search_tag_position: search_tag_position + self.CREATION_DATE_STRING_MAGIC_LENGTH]
-                    match = re.search(self.YEAR_REGEXP, test_string)
-                    if match:
-                        year = int(match[1])
-                        self.logger.debug("Resolve creation year to %d for %s domain", year, domain)
-                        return year
-
-                search_tag_position = response.text.find(self.CREATION_DATE_SEARCH_TAG,
-                                                         search_tag_position + len(self.CREATION_DATE_SEARCH_TAG))
-
-            self.logger.warning("No configured WhoIs provider resolved creation year for %s domain", domain)
-            return self.UNKNOWN_YEAR
+        # A valid year, UNKNOWN_YEAR when some source answered without a creation date, or None when none answered
+        answered = False
+        if self.client:
+            with self.rate_limiter:
+                year = self.client.get_creation_year(domain)
+            if self._is_valid_year(year):
+                return year
+            answered = year is not None
+        providers = WhoIsProvider.order(self.providers)
+        if not self.hedge_pool:
+            for attempt, provider in enumerate(providers):
+                year = self._query_provider(provider, domain, attempt > 0)
+                if self._is_valid_year(year):
+                    return year
+                answered = answered or year is not None
+            return self._no_year_resolved(domain, answered)
+
+        # Hedged lookup: the next provider starts when the previous ones fail or stay silent for hedge_delay
+        pending = set()
+        while providers or pending:
+            if providers:
+                retry = len(providers) < len(self.providers)
+                pending.add(self.hedge_pool.submit(self._query_provider, providers.pop(0), domain, retry))
+            done, pending = concurrent.futures.wait(pending,
+                                                    timeout=self.hedge_delay if providers else None,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if self._is_valid_year(future.result()):
+                    return future.result()
+                answered = answered or future.result() is not None
+        return self._no_year_resolved(domain, answered)
+
+    async def get_creation_year_async(self, domain):
+        answered = False
+        if self.client:
+            request_started = await self.rate_limiter.acquire_async()
+            year = None
+            try:
+                year = await self.client.get_creation_year_async(domain)
+            finally:
+                self.rate_limiter.release(started=request_started, error=year is None)
+            if self._is_valid_year(year):
+                return year
+            answered = year is not None
+        providers = WhoIsProvider.order(self.providers)
+        pending = set()
+        try:
+            while providers or pending:
+                if providers:
+                    retry = len(providers) < len(self.providers)
+                    pending.add(asyncio.ensure_future(self._query_provider_async(providers.pop(0), domain, retry)))
+                done, pending = await asyncio.wait(pending,
+                                                   timeout=self.hedge_delay if providers and self.hedge_delay > 0 else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if self._is_valid_year(task.result()):
+                        return task.result()
+                    answered = answered or task.result() is not None
+        finally:
+            for task in pending:
+                task.cancel()
+        return self._no_year_resolved(domain, answered)
+
+    def _query_provider(self, provider, domain, retry=False):
+        self.logger.debug("Requesting %s for domain %s", provider.url, domain)
+        started = time.monotonic()
+        try:
+            # Falling back to the next provider is the retry, the HTTP client must not wait on this one
+            with self.rate_limiter:
+                status, data = self.http_client.fetch(provider.url + domain, provider.headers,
+                                                      Constants.WHOIS_REQUEST_TIMEOUT, retries=0)
+        except requests.RequestException as e:
+            self.logger.debug("Request to %s for %s failed: %s", provider.url, domain, str(e))
+            provider.record(False, time.monotonic() - started, retry=retry)
+            return None
+        # Raw bytes go straight to the parser, the body is never decoded into text
+        return self._handle_response(provider, domain, status, data, started, retry)
+
+    async def _query_provider_async(self, provider, domain, retry=False):
+        self.logger.debug("Requesting %s for domain %s", provider.url, domain)
+        request_started = await self.rate_limiter.acquire_async()
+        started = time.monotonic()
+        failed = False
+        try:
+            status, data = await self.http_client.fetch_async(provider.url + domain, provider.headers,
+                                                              Constants.WHOIS_REQUEST_TIMEOUT, retries=0)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.debug("Request to %s for %s failed: %s", provider.url, domain, str(e))
+            provider.record(False, time.monotonic() - started, retry=retry)
+            failed = True
+            return None
+        finally:
+            self.rate_limiter.release(started=request_started, error=failed)
+        return self._handle_response(provider, domain, status, data, started, retry)
+
+    def _handle_response(self, provider, domain, status, data, started, retry=False):
+        if status != 200:
+            self.logger.debug("Got %d HTTP status code from %s for %s", status, provider.url, domain)
+            if status == RateLimiter.THROTTLE_STATUS_CODE:
+                self.rate_limiter.report_throttle()
+            provider.record(False, time.monotonic() - started, retry=retry)
+            return None
+
+        year = self._parse_creation_year(data, provider, domain)
+        provider.record(year is not None, time.monotonic() - started, len(data), retry)
+        return year
+
+    def _is_valid_year(self, year):
+        return year is not None and year != Constants.UNKNOWN_YEAR
+
+    def _no_year_resolved(self, domain, answered):
+        if not answered:
+            self.logger.warning("No WhoIs source answered for %s domain", domain)
+            return None
+        self.logger.warning("No configured WhoIs provider resolved creation year for %s domain", domain)
+        return Constants.UNKNOWN_YEAR
+
+    def _parse_creation_year(self, data, provider, domain):
+        year = provider.parser.parse(data)
+        if year is None:
+            self.logger.debug("Maybe captcha. Cannot find any search tag in %s for %s", provider.url, domain)
+            self.rate_limiter.report_throttle()
+        elif year == Constants.UNKNOWN_YEAR:
+            self.logger.debug("No creation year found in %s response for %s domain", provider.url, domain)
+        else:
+            self.logger.debug("Resolve creation year to %d for %s domain", year, domain)
+        return year
 
     def _extract_domain(self, url):
         domain = url
@@ -0,0 +1,40 @@
+import time
+import logging
+
+from statsbot.constants import Constants
+from statsbot.json_store import JsonStore
+
+
+class WhoIsCache:
+    def __init__(self, config):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.negative_ttl = float(config.get(Constants.CONFIG_WHOIS_NEGATIVE_TTL,
+                                             Constants.WHOIS_DEFAULT_NEGATIVE_TTL)) * 3600
+        self.store = JsonStore(Constants.WHOIS_CACHE_FILE)
+        self.hits = 0
+        self.misses = 0
+
+    def get_year(self, domain):
+        entry = self.store.get(self._normalize(domain), {})
+        year = entry.get("year")
+        if year is None or (year == Constants.UNKNOWN_YEAR and time.time() - entry.get("time", 0) > self.negative_ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return year
+
+    def set_year(self, domain, year):
+        self.store.update(self._normalize(domain), year=year, time=time.time())
+
+    def get_parent(self, domain):
+        return self.store.get(self._normalize(domain), {}).get("parent", "")
+
+    def set_parent(self, domain, parent):
+        self.store.update(self._normalize(domain), parent=self._normalize(parent))
+
+    def flush(self):
+        self.logger.info("WhoIs cache: %d hit(s), %d miss(es)", self.hits, self.misses)
+        self.store.store()
+
+    def _normalize(self, domain):
+        return domain.strip().rstrip(".").split(":")[0].lower()
@@ -0,0 +1,253 @@
+import re
+import json
+import time
+import socket
+import asyncio
+import logging
+
+import aiohttp
+import requests
+
+from statsbot.constants import Constants
+from statsbot.http_client import HttpClient
+from statsbot.metrics import Metrics
+
+
+class WhoIsResponse:
+    # Incremental WHOIS reader: lines are scanned as they arrive, so the caller can hang up once the date is known
+    CREATION_KEYS = {"creation date", "created", "created on", "created date", "creation-date",
+                     "registered", "registered on", "registration date", "registration time",
+                     "domain registration date", "domain create date", "domain name commencement date"}
+    REFERRAL_KEYS = {"refer", "whois", "registrar whois server", "referralserver"}
+    YEAR_REGEXP = re.compile(rb"(?<!\d)((?:19|20)\d{2})(?!\d)")
+    # gTLD registries close the record with this line, only the legal notice follows
+    RECORD_END = b">>> last update of"
+
+    def __init__(self, tld_record=False):
+        self.buffer = b""
+        self.size = 0
+        self.year = None
+        self.referral = ""
+        self.complete = False
+        # IANA describes the TLD itself, its created line is the delegation date and only the referral counts
+        self.tld_record = tld_record
+
+    def feed(self, data):
+        self.size += len(data)
+        lines = (self.buffer + data).split(b"\n")
+        self.buffer = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+            if self.year is not None or self.complete or (self.tld_record and self.referral):
+                return True
+        return False
+
+    def finish(self):
+        if self.buffer:
+            self._parse_line(self.buffer)
+            self.buffer = b""
+
+    def _parse_line(self, line):
+        if line.lstrip().lower().startswith(self.RECORD_END):
+            self.complete = True
+            return
+        key, separator, value = line.partition(b":")
+        if not separator:
+            return
+        key = key.strip().lower().decode("utf-8", errors="replace")
+        if key in self.CREATION_KEYS and not self.tld_record:
+            match = self.YEAR_REGEXP.search(value)
+            if match:
+                self.year = int(match[1])
+        elif key in self.REFERRAL_KEYS and not self.referral:
+            referral = value.strip().decode("utf-8", errors="replace")
+            # Referrals come as bare host names or whois:// URLs, anything with a path is a web form
+            referral = referral.split("://", 1)[-1].rstrip("/")
+            if referral and "/" not in referral:
+                self.referral = referral
+
+
+class WhoIsClient:
+    PORT = 43
+    IANA_SERVER = "whois.iana.org"
+    # Registries that answer with the creation date on port 43, anything else is asked through IANA referrals
+    SERVERS = {
+        "com": "whois.verisign-grs.com",
+        "net": "whois.verisign-grs.com",
+        "org": "whois.pir.org",
+        "info": "whois.nic.info",
+        "biz": "whois.nic.biz",
+        "io": "whois.nic.io",
+        "co": "whois.nic.co",
+        "me": "whois.nic.me",
+        "tv": "whois.nic.tv",
+        "cc": "ccwhois.verisign-grs.com",
+        "ru": "whois.tcinet.ru",
+        "su": "whois.tcinet.ru",
+        "xn--p1ai": "whois.tcinet.ru",
+        "ua": "whois.ua",
+        "by": "whois.cctld.by",
+        "kz": "whois.nic.kz",
+        "uk": "whois.nic.uk",
+        "co.uk": "whois.nic.uk",
+        "fr": "whois.nic.fr",
+        "it": "whois.nic.it",
+        "pl": "whois.dns.pl",
+        "nl": "whois.domain-registry.nl",
+        "eu": "whois.eu",
+        "us": "whois.nic.us",
+        "ca": "whois.cira.ca",
+        "au": "whois.auda.org.au",
+        "in": "whois.registry.in",
+        "cn": "whois.cnnic.cn",
+    }
+    # RDAP answers are small JSON documents with an exact registration event, preferred where available
+    RDAP_SERVERS = {
+        "com": "https://rdap.verisign.com/com/v1/",
+        "net": "https://rdap.verisign.com/net/v1/",
+        "org": "https://rdap.publicinterestregistry.org/rdap/",
+        "io": "https://rdap.identitydigital.services/rdap/",
+        "info": "https://rdap.identitydigital.services/rdap/",
+    }
+
+    RDAP_HEADERS = {"Accept": "application/rdap+json"}
+
+    def __init__(self, http_client=None, timeout=Constants.WHOIS_REQUEST_TIMEOUT):
+        self.logger = logging.getLogger(Constants.LOGGER_NAME)
+        self.timeout = timeout
+        self.http_client = http_client or HttpClient.get()
+
+    def get_tld(self, domain, table):
+        # Longest matching suffix, so co.uk wins over uk
+        labels = domain.lower().rstrip(".").split(".")
+        for index in range(1, len(labels)):
+            suffix = ".".join(labels[index:])
+            if suffix in table:
+                return suffix
+        return ""
+
+    def get_creation_year(self, domain):
+        tld = self.get_tld(domain, self.RDAP_SERVERS)
+        if tld:
+            year = self._query_rdap(self.RDAP_SERVERS[tld], domain)
+            if year is not None:
+                return year
+        return self._query_whois(domain)
+
+    async def get_creation_year_async(self, domain):
+        tld = self.get_tld(domain, self.RDAP_SERVERS)
+        if tld:
+            year = await self._query_rdap_async(self.RDAP_SERVERS[tld], domain)
+            if year is not None:
+                return year
+        return await self._query_whois_async(domain)
+
+    def _get_first_server(self, domain):
+        tld = self.get_tld(domain, self.SERVERS)
+        return self.SERVERS[tld] if tld else self.IANA_SERVER
+
+    def _query_whois(self, domain):
+        server = self._get_first_server(domain)
+        response = None
+        for _ in range(Constants.WHOIS_MAX_REFERRALS + 1):
+            started = time.perf_counter()
+            response = WhoIsResponse(server == self.IANA_SERVER)
+            try:
+                with socket.create_connection(self._get_address(server), timeout=self.timeout) as connection:
+                    connection.sendall(domain.encode("idna") + b"\r\n")
+                    while response.size < Constants.WHOIS_MAX_RESPONSE_SIZE:
+                        data = connection.recv(Constants.WHOIS_READ_SIZE)
+                        if response.feed(data) or not data:
+                            break
+            except (OSError, UnicodeError) as e:
+                self.logger.debug("WhoIs query to %s for %s failed: %s", server, domain, str(e))
+                self._record("whois", server, started, response.size, True)
+                return None
+            response.finish()
+            server = self._next_server(domain, server, response, started)
+            if not server:
+                break
+        return response.year if response.year is not None else Constants.UNKNOWN_YEAR
+
+    async def _query_whois_async(self, domain):
+        server = self._get_first_server(domain)
+        response = None
+        for _ in range(Constants.WHOIS_MAX_REFERRALS + 1):
+            started = time.perf_counter()
+            response = WhoIsResponse(server == self.IANA_SERVER)
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(*self._get_address(server)),
+                                                        self.timeout)
+                writer.write(domain.encode("idna") + b"\r\n")
+                await writer.drain()
+                while response.size < Constants.WHOIS_MAX_RESPONSE_SIZE:
+                    data = await asyncio.wait_for(reader.read(Constants.WHOIS_READ_SIZE), self.timeout)
+                    if response.feed(data) or not data:
+                        break
+            except (OSError, UnicodeError, asyncio.TimeoutError) as e:
+                self.logger.debug("WhoIs query to %s for %s failed: %s", server, domain, str(e))
+                self._record("whois", server, started, response.size, True)
+                return None
+            finally:
+                if writer is not None:
+                    writer.close()
+            response.finish()
+            server = self._next_server(domain, server, response, started)
+            if not server:
+                break
+        return response.year if response.year is not None else Constants.UNKNOWN_YEAR
+
+    def _get_address(self, server):
+        host, _, port = server.partition(":")
+        return host, int(port) if port else self.PORT
+
+    def _next_server(self, domain, server, response, started):
+        self._record("whois", server, started, response.size, False)
+        if response.year is not None:
+            self.logger.debug("Resolve creation year to %d for %s domain through %s", response.year, domain, server)
+            return ""
+        if response.referral and response.referral.lower() != server.lower():
+            self.logger.debug("WhoIs server %s refers %s to %s", server, domain, response.referral)
+            return response.referral
+        return ""
+
+    def _query_rdap(self, base_url, domain):
+        started = time.perf_counter()
+        body = b""
+        try:
+            # A failed RDAP query falls back to port 43, so it is never retried
+            status, body = self.http_client.fetch(base_url + "domain/" + domain, self.RDAP_HEADERS, self.timeout,
+                                                  retries=0)
+            data = json.loads(body) if status == 200 else None
+        except (requests.RequestException, ValueError) as e:
+            self.logger.debug("RDAP query to %s for %s failed: %s", base_url, domain, str(e))
+            data = None
+        return self._handle_rdap(base_url, domain, data, started, len(body))
+
+    async def _query_rdap_async(self, base_url, domain):
+        started = time.perf_counter()
+        body = b""
+        try:
+            status, body = await self.http_client.fetch_async(base_url + "domain/" + domain, self.RDAP_HEADERS,
+                                                              self.timeout, retries=0)
+            data = json.loads(body) if status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self.logger.debug("RDAP query to %s for %s failed: %s", base_url, domain, str(e))
+            data = None
+        return self._handle_rdap(base_url, domain, data, started, len(body))
+
+    def _handle_rdap(self, base_url, domain, data, started, size):
+        self._record("rdap", base_url, started, size, data is None)
+        if data is None:
+            return None
+        for event in data.get("events", []):
+            if event.get("eventAction") == "registration":
+                match = WhoIsResponse.YEAR_REGEXP.search(str(event.get("eventDate", "")).encode())
+                if match:
+                    return int(match[1])
+        return Constants.UNKNOWN_YEAR
+
+    def _record(self, protocol, server, started, size, failed):
+        Metrics.get().record("whois_native", time.perf_counter() - started, error=failed, size=size,
+                             protocol=protocol, server=server)
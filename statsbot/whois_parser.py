@@ -0,0 +1,61 @@
+import re
+
+from statsbot.constants import Constants
+
+
+class WhoIsParser:
+    # How far after a creation label the date may start, markup between label and value included
+    DATE_WINDOW = 60
+    YEAR = rb"((?:19|20)\d{2})"
+    MONTH_NAME = rb"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]{0,6}\.?"
+    # 2004-05-12, 2004.05.12, 2004/05/12T..., 12.05.2004, 12-05-2004, 12-May-2004, 12 May 2004, May 12, 2004
+    DATE_FORMATS = [YEAR + rb"[-./]\d{1,2}[-./]\d{1,2}",
+                    rb"\d{1,2}[-./]\d{1,2}[-./]" + YEAR,
+                    rb"\d{1,2}[-./ ]" + MONTH_NAME + rb"[-./ ]" + YEAR,
+                    MONTH_NAME + rb" \d{1,2},? " + YEAR]
+    # Creation labels as (literal found with bytes.find, letters allowed right before it, required continuation):
+    # Creation Date, created, Created On, Registered on, Registration Time, Commencement Date
+    LABELS = [(b"reat", b"cC", b""),
+              (b"REAT", b"C", b""),
+              (b"egistered", b"rR", rb" on"),
+              (b"egistration", b"rR", rb" (?:date|time)"),
+              (b"ommencement", b"cC", rb" date")]
+
+    def __init__(self, tags, end_tag=None):
+        self.tags = [tag.encode("utf-8") for tag in tags]
+        # Providers printing the raw record in one element close it with end_tag, the page after it is never scanned
+        self.end_tag = end_tag.encode("utf-8") if end_tag else None
+        # Regular expressions only run anchored right after a label, the page itself is scanned by bytes.find
+        self.labels = [(literal, prefixes,
+                        re.compile(rb"(?i:%s)[\s\S]{0,%d}?(?<![\d.])(?i:%s)(?!\d)" %
+                                   (continuation, self.DATE_WINDOW, b"|".join(self.DATE_FORMATS))))
+                       for literal, prefixes, continuation in self.LABELS]
+
+    def parse(self, data):
+        # The first provider tag marks the raw record, the first dated creation label after it wins.
+        # None means the record is missing, which is how captcha pages look
+        start = -1
+        for tag in self.tags:
+            start = data.find(tag)
+            if start > 0:
+                break
+        if start <= 0:
+            return None
+        end = data.find(self.end_tag, start) if self.end_tag else -1
+        if end < 0:
+            end = len(data)
+
+        candidates = [[data.find(literal, start, end), literal, prefixes, pattern]
+                      for literal, prefixes, pattern in self.labels]
+        candidates = [candidate for candidate in candidates if candidate[0] >= 0]
+        while candidates:
+            candidate = min(candidates, key=lambda item: item[0])
+            position, literal, prefixes, pattern = candidate
+            if data[position - 1] in prefixes:
+                match = pattern.match(data, position + len(literal), end)
+                if match:
+                    return int(next(group for group in match.groups() if group))
+            candidate[0] = data.find(literal, position + len(literal), end)
+            if candidate[0] < 0:
+                candidates.remove(candidate)
+        return Constants.UNKNOWN_YEAR
@@ -0,0 +1,48 @@
+import random
+import threading
+
+from statsbot.metrics import Metrics
+from statsbot.whois_parser import WhoIsParser
+
+
+class WhoIsProvider:
+    EWMA_WEIGHT = 0.2
+    MIN_SUCCESS_RATE = 0.05
+    EXPLORATION_CHANCE = 0.1
+
+    def __init__(self, url, tags, headers, end_tag=None):
+        self.url = url
+        self.tags = tags
+        self.parser = WhoIsParser(tags, end_tag)
+        self.headers = headers
+        self.success_rate = 1.0
+        self.latency = 1.0
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    def record(self, success, latency, size=0, retry=False):
+        Metrics.get().record("whois_provider", latency, error=not success, retries=int(retry), size=size,
+                             provider=self.url)
+        with self.lock:
+            self.request_count += 1
+            self.success_rate += self.EWMA_WEIGHT * ((1.0 if success else 0.0) - self.success_rate)
+            self.latency += self.EWMA_WEIGHT * (latency - self.latency)
+
+    def score(self):
+        # Expected time to a usable answer: lower is better
+        with self.lock:
+            return self.latency / max(self.success_rate, self.MIN_SUCCESS_RATE)
+
+    def get_stats(self):
+        with self.lock:
+            return {"provider": self.url,
+                    "requests": self.request_count,
+                    "success_rate": round(self.success_rate, 3),
+                    "latency": round(self.latency, 3)}
+
+    @classmethod
+    def order(cls, providers):
+        # Mostly best-first, sometimes shuffled so that deprioritized providers get a chance to recover
+        if random.random() < cls.EXPLORATION_CHANCE:
+            return random.sample(providers, len(providers))
+        return sorted(providers, key=lambda provider: provider.score())
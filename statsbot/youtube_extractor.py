@@ -1,38 +1,174 @@
+import json
 import datetime
 import logging
-
-import urllib.request, json
+import threading
 
 from statsbot.constants import Constants
 from statsbot.extractor import Extractor
+from statsbot.http_client import HttpClient, HttpStatusError
+from statsbot.json_store import JsonStore
+from statsbot.metrics import Metrics
+from statsbot.post_index import PostIndex
+from statsbot.rate_limiter import RateLimiter
 
 
 class YoutubeExtractor(Extractor):
-    CHANNEL_INFO_ENDPOINT = "https://youtube.googleapis.com/youtube/v3/channels?part=statistics&id={0}&key={1}"
-    CHANNEL_VIDEOS_ENDPOINT = "https://www.googleapis.com/youtube/v3/search?order=date&part=snippet&channelId={0}&maxResults={1}&key={2}"
+    PLATFORM = Constants.YOUTUBE_PLATFORM
+    NATIVE_ASYNC = True
+    BATCH_SIZE = 50
+    FIELDS = Constants.YOUTUBE_FILTERS[1:] + Constants.YOUTUBE_OPTIONAL_FILTERS
+
+    CHANNEL_INFO_ENDPOINT = "https://youtube.googleapis.com/youtube/v3/channels?part={0}&id={1}&maxResults={2}&key={3}"
+    PLAYLIST_ITEMS_ENDPOINT = "https://youtube.googleapis.com/youtube/v3/playlistItems?part=contentDetails&playlistId={0}&maxResults={1}&pageToken={2}&key={3}"
+
+    CHANNEL_INFO_QUOTA_COST = 1
+    PLAYLIST_ITEMS_QUOTA_COST = 1
+    PLAYLIST_ITEMS_PAGE_SIZE = 50
+
+    NOT_MODIFIED_STATUS_CODE = 304
+    DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
 
     def __init__(self, config):
         self.logger = logging.getLogger(Constants.LOGGER_NAME)
         self.config = config
+        self.http_client = HttpClient.get(config)
+        self.rate_limiter = RateLimiter.from_config(self.PLATFORM, self.config)
+        self.channels = JsonStore(Constants.YOUTUBE_CACHE_FILE)
+        self.post_index = PostIndex(self.PLATFORM)
+        self.quota_lock = threading.Lock()
+        self.quota_units = 0
+        self.not_modified_count = 0
+
+    async def on_start_async(self):
+        await self.http_client.start_async()
+
+    async def on_stop_async(self):
+        await self.http_client.stop_async()
+
+    def flush(self):
+        # Flushed after every run, so the counters report what a single run spent
+        with self.quota_lock:
+            self.logger.info("Youtube quota units spent: %d, %d response(s) not modified",
+                             self.quota_units, self.not_modified_count)
+            self.quota_units = 0
+            self.not_modified_count = 0
+        self.channels.store()
+        self.post_index.flush()
+
+    def get_key(self, user):
+        return self._extract_channel_id(user.get(Constants.YOUTUBE_PAGE, ""))
 
     def get_stats(self, user):
-        updated_user = {}
-        if not self.is_working():
-            self.logger.error("Skip collecting Youtube statistics: login failure")
-            return updated_user
+        return self._drive(self._collect_stats([user]))[0]
+
+    async def get_stats_async(self, user):
+        return (await self._drive_async(self._collect_stats([user])))[0]
 
-        if not user.get(Constants.YOUTUBE_PAGE, ""):
-            return updated_user
+    def get_stats_batch(self, users):
+        return self._drive(self._collect_stats(users))
 
+    async def get_stats_batch_async(self, users):
+        return await self._drive_async(self._collect_stats(users))
+
+    def _drive(self, flow):
+        # _collect_stats yields (url, etag) requests and expects decoded JSON responses back,
+        # or None when the etag still matches, so the same logic serves blocking and asyncio run modes
+        try:
+            url, etag = next(flow)
+            while True:
+                headers = {"If-None-Match": etag} if etag else {}
+                try:
+                    with self.rate_limiter:
+                        response = self._fetch(url, headers)
+                except Exception as e:
+                    url, etag = flow.throw(e)
+                    continue
+                url, etag = flow.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    def _fetch(self, url, headers):
+        return self._decode(url, *self.http_client.fetch(url, headers))
+
+    def _decode(self, url, status, body):
+        if status == self.NOT_MODIFIED_STATUS_CODE:
+            return None
+        if status >= 400:
+            raise HttpStatusError(url, status)
+        Metrics.get().add_bytes("request", len(body), platform=self.PLATFORM)
+        return json.loads(body.decode())
+
+    async def _drive_async(self, flow):
         try:
-            channel_id = self._extract_channel_id(user[Constants.YOUTUBE_PAGE])
-            self.logger.debug("Requesting statistics for youtube channel, id: %s", channel_id)
+            url, etag = next(flow)
+            while True:
+                headers = {"If-None-Match": etag} if etag else {}
+                started = await self.rate_limiter.acquire_async()
+                try:
+                    response = self._decode(url, *(await self.http_client.fetch_async(url, headers)))
+                except Exception as e:
+                    self.rate_limiter.release(throttled=self.rate_limiter.is_throttle_error(e), started=started, error=True)
+                    url, etag = flow.throw(e)
+                else:
+                    self.rate_limiter.release(started=started)
+                    url, etag = flow.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    def _spend_quota(self, units):
+        with self.quota_lock:
+            self.quota_units += units
 
-            url = YoutubeExtractor.CHANNEL_INFO_ENDPOINT.format(channel_id, self.config[Constants.CONFIG_YOUTUBE_TOKEN])
-            with urllib.request.urlopen(url) as request:
-                response = json.loads(request.read().decode())
+    def _collect_stats(self, users):
+        updated_users = [{} for _ in users]
+        if not self.is_working():
+            self.logger.error("Skip collecting Youtube statistics: login failure")
+            return updated_users
+
+        user_indexes = {}
+        for index, user in enumerate(users):
+            if user.get(Constants.YOUTUBE_PAGE, ""):
+                user_indexes.setdefault(self._extract_channel_id(user[Constants.YOUTUBE_PAGE]), []).append(index)
+        if not user_indexes:
+            return updated_users
+
+        # Up to BATCH_SIZE channel ids share one statistics request
+        channel_ids = list(user_indexes.keys())
+        statistics = {}
+        for offset in range(0, len(channel_ids), self.BATCH_SIZE):
+            batch = channel_ids[offset: offset + self.BATCH_SIZE]
+            parts = "statistics"
+            if any(not self.channels.get(channel_id, {}).get("uploads") for channel_id in batch):
+                parts = "statistics,contentDetails"
+            try:
+                self.logger.debug("Requesting statistics for %d youtube channel(s), ids: %s", len(batch), str(batch))
+                self._spend_quota(self.CHANNEL_INFO_QUOTA_COST)
+                response = yield (YoutubeExtractor.CHANNEL_INFO_ENDPOINT.format(parts,
+                                                                                ",".join(batch),
+                                                                                len(batch),
+                                                                                self.config[Constants.CONFIG_YOUTUBE_TOKEN]),
+                                  "")
+                for item in response.get("items", []):
+                    statistics[item["id"]] = item["statistics"]
+                    uploads = item.get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads")
+                    if uploads:
+                        self.channels.update(item["id"], uploads=uploads)
+            except Exception as e:
+                self.logger.warning("Failed to collect stats for Youtube channels %s", str(batch))
+                self.logger.warning(e)
+
+        for channel_id, indexes in user_indexes.items():
+            updated_user = yield from self._collect_channel_stats(channel_id, statistics.get(channel_id))
+            for index in indexes:
+                updated_users[index] = updated_user
+        return updated_users
+
+    def _collect_channel_stats(self, channel_id, youtube_statistics):
+        updated_user = {}
+        try:
+            if youtube_statistics is None:
+                raise ValueError("No statistics returned for channel " + channel_id)
 
-            youtube_statistics = response["items"][0]["statistics"]
             updated_user[Constants.YOUTUBE_POST_COUNT] = int(youtube_statistics["videoCount"])
             updated_user[Constants.YOUTUBE_FOLLOWERS] = int(youtube_statistics["subscriberCount"])
             updated_user[Constants.YOUTUBE_POST_LAST_N_DAYS_COUNT] = 0
@@ -42,24 +178,11 @@ class YoutubeExtractor(Extractor):
                 self.logger.debug("No videos on youtube channel, id: %s", channel_id)
                 return updated_user
 
-            url = YoutubeExtractor.CHANNEL_VIDEOS_ENDPOINT.format(channel_id,
-                                                                  Constants.SINGLE_REQUEST_POST_COUNT,
-                                                                  self.config[Constants.CONFIG_YOUTUBE_TOKEN])
-            with urllib.request.urlopen(url) as request:
-                response = json.loads(request.read().decode())
-
-            last_n_days_post_count = 0
-            last_n_days = datetime.datetime.now() - datetime.timedelta(days=Constants.LAST_N_DAYS)
+            yield from self._collect_recent_uploads(channel_id)
 
-            for item in response["items"]:
-                post_naive_date = datetime.datetime.strptime(item["snippet"]["publishedAt"], "%Y-%m-%dT%H:%M:%S%z").replace(tzinfo=None)
-                if post_naive_date >= last_n_days:
-                    last_n_days_post_count += 1
-                else:
-                    break
-
-            updated_user[Constants.YOUTUBE_POST_LAST_N_DAYS_COUNT] = last_n_days_post_count
-            updated_user[Constants.YOUTUBE_POST_LAST_DATE] = str(response["items"][0]["snippet"]["publishedAt"])
+            last_post_date = self.post_index.get_newest(channel_id)
+            updated_user.update(self.post_index.get_window_counts(channel_id, Constants.YOUTUBE_POST_LAST_DAYS_COUNT))
+            updated_user[Constants.YOUTUBE_POST_LAST_DATE] = str(last_post_date) if last_post_date else ""
 
             self.logger.debug("Youtube channel '%s' processed: followers %d, video total %d, last %d days %d, last date %s",
                               channel_id,
@@ -73,6 +196,49 @@ class YoutubeExtractor(Extractor):
             self.logger.warning(e)
         return updated_user
 
+    def _collect_recent_uploads(self, channel_id):
+        channel = self.channels.get(channel_id, {})
+        uploads = channel.get("uploads")
+        if not uploads:
+            raise ValueError("No uploads playlist known for channel " + channel_id)
+
+        # Uploads playlist is newest first: stop paging at the indexed videos or past the largest counted window
+        newest_indexed = self.post_index.get_newest(channel_id)
+        oldest_needed = self.post_index.get_oldest_needed()
+        published = []
+        etag = ""
+        page_token = ""
+        while True:
+            self._spend_quota(self.PLAYLIST_ITEMS_QUOTA_COST)
+            response = yield (YoutubeExtractor.PLAYLIST_ITEMS_ENDPOINT.format(uploads,
+                                                                              self.PLAYLIST_ITEMS_PAGE_SIZE,
+                                                                              page_token,
+                                                                              self.config[Constants.CONFIG_YOUTUBE_TOKEN]),
+                              "" if page_token or newest_indexed is None else channel.get("etag", ""))
+            if response is None:
+                self.logger.debug("No new videos on youtube channel, id: %s", channel_id)
+                with self.quota_lock:
+                    self.not_modified_count += 1
+                return
+
+            if not page_token:
+                etag = response.get("etag", "")
+            page_published = [self._parse_date(item["contentDetails"]["videoPublishedAt"])
+                              for item in response.get("items", [])
+                              if item.get("contentDetails", {}).get("videoPublishedAt")]
+            published.extend(page_published)
+
+            page_token = response.get("nextPageToken", "")
+            if not page_token or not page_published or min(page_published) < oldest_needed or \
+                    (newest_indexed and min(page_published) <= newest_indexed):
+                break
+
+        self.post_index.add(channel_id, published)
+        self.channels.update(channel_id, etag=etag)
+
+    def _parse_date(self, date):
+        return datetime.datetime.strptime(date, self.DATE_FORMAT).replace(tzinfo=None)
+
     def _extract_channel_id(self, url):
         if not url:
             return ""
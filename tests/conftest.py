@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    # Caches, journals and lease databases are written relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
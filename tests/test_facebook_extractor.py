@@ -0,0 +1,39 @@
+import datetime
+
+from statsbot import facebook_extractor
+from statsbot.constants import Constants
+from statsbot.facebook_extractor import FacebookExtractor
+
+CONFIG = {Constants.CONFIG_FACEBOOK_USERNAME: "user",
+          Constants.CONFIG_FACEBOOK_PASSWORD: "password"}
+
+
+def make_post(post_id, days_ago):
+    post_time = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(days=days_ago)
+    return {"post_id": post_id, "time": post_time}
+
+
+def make_extractor(monkeypatch, pages):
+    # Every get_posts call returns the next page, newest first as the scraper does
+    monkeypatch.setattr(facebook_extractor, "set_cookies", lambda path: None)
+    monkeypatch.setattr(facebook_extractor, "get_page_info", lambda page_name: {"followers": 10})
+    monkeypatch.setattr(facebook_extractor, "get_posts", lambda page_name, **kwargs: iter(pages.pop(0)))
+    return FacebookExtractor(CONFIG)
+
+
+def test_pinned_watermark_post_does_not_hide_newer_posts(monkeypatch):
+    p1, p2, p3 = make_post("p1", 20), make_post("p2", 10), make_post("p3", 5)
+    p4, p5 = make_post("p4", 2), make_post("p5", 1)
+    extractor = make_extractor(monkeypatch, [[p3, p2, p1],
+                                             [p3, p5, p4, p2, p1]])
+    user = {Constants.FACEBOOK_PAGE: "https://www.facebook.com/page"}
+
+    first = extractor.get_stats(user)
+    assert first[Constants.FACEBOOK_POST_COUNT] == 3
+    assert first[Constants.FACEBOOK_POST_LAST_DATE] == str(p3["time"])
+
+    # p3, the watermark post, is now pinned in front of the newer p5 and p4
+    second = extractor.get_stats(user)
+    assert second[Constants.FACEBOOK_POST_COUNT] == 5
+    assert second[Constants.FACEBOOK_POST_LAST_DATE] == str(p5["time"])
+    assert second[Constants.FACEBOOK_POST_LAST_N_DAYS_COUNT] == 5
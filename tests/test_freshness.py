@@ -0,0 +1,25 @@
+from statsbot.constants import Constants
+from statsbot.freshness import Freshness
+
+CONFIG = {Constants.CONFIG_FRESHNESS.format(Freshness.DEFAULT): "24"}
+USERS = [{Constants.SITE_TAG: "a.com", Constants.SITE_YEAR_TAG: "2000"}]
+
+
+def is_fresh():
+    return Freshness(CONFIG).is_fresh(Constants.WHOIS_PLATFORM, "a.com", USERS, [Constants.SITE_YEAR_TAG])
+
+
+def test_touches_are_persisted_on_flush():
+    freshness = Freshness(CONFIG)
+    freshness.touch(Constants.WHOIS_PLATFORM, "a.com", [Constants.SITE_YEAR_TAG])
+    assert not is_fresh()
+    freshness.flush()
+    assert is_fresh()
+
+
+def test_touches_of_a_failed_write_back_are_dropped():
+    freshness = Freshness(CONFIG)
+    freshness.touch(Constants.WHOIS_PLATFORM, "a.com", [Constants.SITE_YEAR_TAG])
+    freshness.discard()
+    freshness.flush()
+    assert not is_fresh()
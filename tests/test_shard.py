@@ -0,0 +1,67 @@
+import os
+
+from statsbot.constants import Constants
+from statsbot.extractor import Extractor
+from statsbot.shard import Shard
+from statsbot.stats_bot import StatsBot
+
+CONFIG = {Constants.CONFIG_RUN_IN_PARALLEL: "0",
+          Constants.CONFIG_THREADPOOL_SIZE: "1"}
+DATABASE = os.path.join("cache", "leases.sqlite")
+USERS = [{Constants.SITE_TAG: "a.com"}, {Constants.SITE_TAG: "b.com"}]
+
+
+class SiteExtractor(Extractor):
+    PLATFORM = Constants.WHOIS_PLATFORM
+    FIELDS = [Constants.SITE_YEAR_TAG]
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.calls = []
+
+    def get_key(self, user):
+        return user[Constants.SITE_TAG]
+
+    def get_stats(self, user):
+        self.calls.append(user[Constants.SITE_TAG])
+        if user[Constants.SITE_TAG] in self.failing:
+            return {}
+        return {Constants.SITE_YEAR_TAG: 2000}
+
+
+def run(extractor, shard):
+    stats_bot = StatsBot(CONFIG, extractors=[extractor], shard=shard)
+    try:
+        return stats_bot.run([dict(user) for user in USERS])[0]
+    finally:
+        stats_bot.stop()
+
+
+def test_merge_refetches_lookups_a_worker_failed():
+    worker = SiteExtractor(failing=("b.com",))
+    run(worker, Shard(0, 1, DATABASE, "run-1"))
+    assert sorted(worker.calls) == ["a.com", "b.com"]
+
+    coordinator = SiteExtractor()
+    rows = run(coordinator, Shard(0, 1, DATABASE, "run-1"))
+    assert coordinator.calls == ["b.com"]
+    assert [row.get(Constants.SITE_YEAR_TAG) for row in rows] == [2000, 2000]
+
+
+def test_leases_of_other_workers_are_not_released():
+    holder = Shard(0, 1, DATABASE, "run-1")
+    assert holder.acquire(Constants.WHOIS_PLATFORM, "b.com")
+
+    other = Shard(0, 1, DATABASE, "run-1")
+    other.release(Constants.WHOIS_PLATFORM, "b.com")
+    assert not other.acquire(Constants.WHOIS_PLATFORM, "b.com")
+    holder.close()
+    other.close()
+
+
+def test_results_of_an_earlier_run_are_not_reused():
+    run(SiteExtractor(), Shard(0, 1, DATABASE, "run-1"))
+
+    extractor = SiteExtractor()
+    run(extractor, Shard(0, 1, DATABASE, "run-2"))
+    assert sorted(extractor.calls) == ["a.com", "b.com"]
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from statsbot.constants import Constants
+from statsbot.extractor import Extractor
+from statsbot.stats_bot import StatsBot
+
+ROWS = 10000
+SHARED_KEYS = 100
+
+
+class RowExtractor(Extractor):
+
+    def __init__(self, platform):
+        self.PLATFORM = platform
+
+    def get_stats(self, user):
+        return {self.PLATFORM: user["row"]}
+
+
+class NativeAsyncRowExtractor(RowExtractor):
+    NATIVE_ASYNC = True
+
+    async def get_stats_async(self, user):
+        await asyncio.sleep(0)
+        return self.get_stats(user)
+
+
+class SharedKeyExtractor(RowExtractor):
+    # Rows sharing a key are looked up once and the result fans out to every one of them
+
+    def get_key(self, user):
+        return str(user["row"] % SHARED_KEYS)
+
+    def get_stats(self, user):
+        return {self.PLATFORM: user["row"] % SHARED_KEYS}
+
+
+def expected_row(index):
+    return {"row": index,
+            Constants.WHOIS_PLATFORM: index,
+            Constants.INSTAGRAM_PLATFORM: index,
+            Constants.YOUTUBE_PLATFORM: index % SHARED_KEYS,
+            Constants.FACEBOOK_PLATFORM: index}
+
+
+@pytest.mark.parametrize("run_in_parallel", ["0", "1", Constants.RUN_MODE_ASYNC])
+def test_every_row_gets_its_own_results_once(run_in_parallel):
+    extractors = [NativeAsyncRowExtractor(Constants.WHOIS_PLATFORM),
+                  RowExtractor(Constants.INSTAGRAM_PLATFORM),
+                  SharedKeyExtractor(Constants.YOUTUBE_PLATFORM),
+                  RowExtractor(Constants.FACEBOOK_PLATFORM)]
+    config = {Constants.CONFIG_RUN_IN_PARALLEL: run_in_parallel,
+              Constants.CONFIG_THREADPOOL_SIZE: "5"}
+    stats_bot = StatsBot(config, extractors)
+    try:
+        updated_users, _ = stats_bot.run([{"row": index} for index in range(ROWS)])
+    finally:
+        stats_bot.stop()
+
+    assert len(updated_users) == ROWS
+    for index, user in enumerate(updated_users):
+        assert user == expected_row(index)
+    assert stats_bot.merge_count == ROWS * len(extractors)
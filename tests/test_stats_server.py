@@ -0,0 +1,99 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from statsbot.stats_server import StatsServer
+
+
+class FakeStatsBot:
+
+    def __init__(self, error=None):
+        self.error = error
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.stopped = False
+
+    def run(self, users, on_row=None):
+        self.started.set()
+        self.release.wait()
+        if self.error:
+            raise RuntimeError(self.error)
+        for index, user in enumerate(users):
+            on_row(index, dict(user, done=True))
+
+    def clear_lookup_results(self):
+        pass
+
+    def flush(self, failed=False):
+        pass
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(stats_bot):
+        server = StatsServer(stats_bot, "127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, "http://127.0.0.1:{0}/stats".format(server.http_server.server_address[1])
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.close()
+
+
+def request(url, data=None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_job_state_carries_rows_once_done(make_server):
+    _, url = make_server(FakeStatsBot())
+    status, body = request(url, json.dumps([{"site": "a.com"}]).encode())
+    assert status == 200
+
+    status, state = request(url + "?job={0}&wait=5".format(body["job_id"]))
+    assert status == 200
+    assert state["status"] == "done"
+    assert state["rows"] == [{"site": "a.com", "done": True}]
+
+
+def test_failed_job_reports_its_error(make_server):
+    _, url = make_server(FakeStatsBot(error="sheet is broken"))
+    _, body = request(url, json.dumps([{"site": "a.com"}]).encode())
+
+    status, state = request(url + "?job={0}&wait=5".format(body["job_id"]))
+    assert status == 200
+    assert state["status"] == "failed"
+    assert state["error"] == "sheet is broken"
+    assert state["rows"] == []
+
+
+def test_unknown_job_and_empty_post_are_rejected(make_server):
+    _, url = make_server(FakeStatsBot())
+    assert request(url + "?job=unknown")[0] == 404
+    assert request(url, b"[]")[0] == 400
+    assert request(url, b"")[0] == 400
+
+
+def test_close_waits_for_the_running_job_and_drops_queued_ones(make_server):
+    stats_bot = FakeStatsBot()
+    stats_bot.release.clear()
+    server, _ = make_server(stats_bot)
+    running = server.submit([{"site": "a.com"}])
+    queued = server.submit([{"site": "b.com"}])
+    assert stats_bot.started.wait(5)
+
+    threading.Timer(0.2, stats_bot.release.set).start()
+    server.close()
+    assert running.status == running.DONE
+    assert queued.status == queued.FAILED
@@ -0,0 +1,53 @@
+from statsbot.constants import Constants
+from statsbot.who_is_extractor import WhoIsExtractor
+
+USER = {Constants.SITE_TAG: "https://www.example.com/"}
+
+
+class FakeHttpClient:
+
+    def __init__(self, status, body=b""):
+        self.status = status
+        self.body = body
+        self.calls = 0
+
+    def fetch(self, url, headers=None, timeout=None, retries=0):
+        self.calls += 1
+        return self.status, self.body
+
+
+def make_extractor(http_client):
+    extractor = WhoIsExtractor({})
+    extractor.http_client = http_client
+    return extractor
+
+
+def test_failed_providers_are_not_negatively_cached():
+    http_client = FakeHttpClient(503)
+    extractor = make_extractor(http_client)
+
+    assert extractor.get_stats(USER) == {Constants.SITE_YEAR_TAG: Constants.UNKNOWN_YEAR}
+    assert http_client.calls == len(WhoIsExtractor.CONFIG)
+    assert extractor.cache.get_year("example.com") is None
+
+    extractor.get_stats(USER)
+    assert http_client.calls == 2 * len(WhoIsExtractor.CONFIG)
+
+
+def test_captcha_pages_are_not_negatively_cached():
+    extractor = make_extractor(FakeHttpClient(200, b"<html>Please solve the captcha</html>"))
+
+    assert extractor.get_stats(USER) == {Constants.SITE_YEAR_TAG: Constants.UNKNOWN_YEAR}
+    assert extractor.cache.get_year("example.com") is None
+
+
+def test_answer_without_creation_date_is_negatively_cached():
+    http_client = FakeHttpClient(200, b'<pre id="registryData">Domain Name: EXAMPLE.COM\nStatus: active</pre>')
+    extractor = make_extractor(http_client)
+
+    assert extractor.get_stats(USER) == {Constants.SITE_YEAR_TAG: Constants.UNKNOWN_YEAR}
+    assert extractor.cache.get_year("example.com") == Constants.UNKNOWN_YEAR
+
+    calls = http_client.calls
+    extractor.get_stats(USER)
+    assert http_client.calls == calls